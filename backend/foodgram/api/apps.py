@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from api import signals  # noqa: F401
+        from api.metrics import install_query_metrics
+        from foodgram.db import connect_health_checks
+
+        connect_health_checks()
+        connection_created.connect(install_query_metrics)
@@ -0,0 +1,45 @@
+from hashlib import sha256
+
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from recipes import constants
+
+
+def token_cache_key(key):
+    # Сам токен в ключ кэша не попадает.
+    return f'auth-token:{sha256(key.encode()).hexdigest()}'
+
+
+def forget_tokens(keys):
+    # После коммита, чтобы параллельный запрос не вернул в кэш
+    # ещё не изменённого пользователя.
+    cache_keys = [token_cache_key(key) for key in keys]
+    transaction.on_commit(lambda: cache.delete_many(cache_keys))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication, который хранит пользователя токена в кэше
+    Django и не делает запрос к базе на каждый вызов API.
+
+    В кэш попадает только результат успешной проверки, поэтому
+    неверные токены и неактивные пользователи отклоняются так же,
+    как в TokenAuthentication. Записи удаляются при удалении токена
+    (выход) и сохранении пользователя (смена пароля, блокировка,
+    изменение данных), см. api.signals. Массовый QuerySet.update
+    сигналов не вызывает: такие изменения вступят в силу через
+    TOKEN_CACHE_TIMEOUT. Включается в settings только при общем кэше:
+    сброс в кэше процесса не дошёл бы до других воркеров.
+    """
+
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        user = cache.get(cache_key)
+        if user is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(cache_key, user, constants.TOKEN_CACHE_TIMEOUT)
+            return user, token
+        return user, Token(key=key, user=user)
@@ -0,0 +1,142 @@
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from api.memberships import (FAVORITES, SHOPPING_CART, SUBSCRIPTIONS,
+                             get_memberships, lock_memberships)
+from api.serializers import BulkIdsSerializer
+from recipes.models import (Favorite, FeedItem, Recipe, ShoppingCart,
+                            ShoppingListItem)
+from users.models import Subscription, User
+
+CREATED = 'created'
+DELETED = 'deleted'
+EXISTS = 'exists'
+MISSING = 'missing'
+NOT_FOUND = 'not_found'
+SELF = 'self'
+
+
+class BulkMembership:
+    """
+    Массовое добавление и удаление связей пользователя: избранного,
+    корзины или подписок.
+
+    Тело запроса — {"ids": [...]}. POST добавляет связи одним
+    bulk_create, DELETE удаляет одним запросом, всё в одной
+    транзакции под lock_memberships: существующие связи читаются
+    под блокировкой, поэтому created и deleted означают реально
+    вставленные и удалённые строки. Ответ — результат по каждому id:
+    created/exists/not_found/self для POST и deleted/missing для DELETE.
+    Списки покупок, счётчики и ленты после удаления обновляют сигналы
+    моделей (recipes/signals.py).
+    """
+
+    kind = None
+    model = None
+    field = None
+    targets = None
+
+    def __init__(self, request):
+        self.request = request
+        self.user = request.user
+
+    def handle(self):
+        serializer = BulkIdsSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        with transaction.atomic():
+            lock_memberships(self.user.id)
+            if self.request.method == 'DELETE':
+                results = self.remove(ids)
+            else:
+                results = self.add(ids)
+        get_memberships(self.request).changed(self.kind)
+        return Response(
+            {'results': [
+                {'id': pk, 'status': results[pk]} for pk in ids
+            ]},
+            status=status.HTTP_200_OK
+        )
+
+    def existing(self, ids):
+        return set(self.model.objects.filter(
+            user=self.user, **{f'{self.field}__in': ids}
+        ).values_list(self.field, flat=True))
+
+    def add(self, ids):
+        found = set(self.targets.filter(pk__in=ids).values_list(
+            'pk', flat=True
+        ))
+        existing = self.existing(found)
+        results = {
+            pk: EXISTS if pk in existing else NOT_FOUND for pk in ids
+        }
+        new = [pk for pk in ids if pk in found and pk not in existing]
+        self.model.objects.bulk_create(
+            (
+                self.model(user=self.user, **{self.field: pk})
+                for pk in new
+            ),
+            ignore_conflicts=True
+        )
+        if new:
+            self.added(new)
+        results.update({pk: CREATED for pk in new})
+        return results
+
+    def remove(self, ids):
+        existing = self.existing(ids)
+        if existing:
+            self.model.objects.filter(
+                user=self.user, **{f'{self.field}__in': existing}
+            ).delete()
+        return {pk: DELETED if pk in existing else MISSING for pk in ids}
+
+    def added(self, ids):
+        """
+        Обновление зависимых данных после добавления связей:
+        bulk_create не шлёт post_save, на который они подписаны.
+        """
+
+
+class BulkFavorites(BulkMembership):
+    kind = FAVORITES
+    model = Favorite
+    field = 'recipe_id'
+    targets = Recipe.objects.all()
+
+    def added(self, ids):
+        Recipe.objects.filter(pk__in=ids).add_to_counter(
+            'favorites_count', 1
+        )
+
+
+class BulkShoppingCart(BulkMembership):
+    kind = SHOPPING_CART
+    model = ShoppingCart
+    field = 'recipe_id'
+    targets = Recipe.objects.all()
+
+    def added(self, ids):
+        ShoppingListItem.objects.add_recipes([self.user.id], ids)
+        Recipe.objects.filter(pk__in=ids).add_to_counter(
+            'shopping_cart_count', 1
+        )
+
+
+class BulkSubscriptions(BulkMembership):
+    kind = SUBSCRIPTIONS
+    model = Subscription
+    field = 'author_id'
+    targets = User.objects.all()
+
+    def add(self, ids):
+        own = self.user.id in ids
+        results = super().add([pk for pk in ids if pk != self.user.id])
+        if own:
+            results[self.user.id] = SELF
+        return results
+
+    def added(self, ids):
+        FeedItem.objects.follow(self.user.id, ids)
@@ -0,0 +1,134 @@
+from django.core.cache import cache
+from django.utils.http import (http_date, parse_etags, parse_http_date_safe,
+                               quote_etag)
+from rest_framework import status
+from rest_framework.response import Response
+
+from recipes import constants, versions
+from recipes.versions import get_version
+
+
+class VersionedCacheMixin:
+    """
+    Условные GET-запросы и кэш ответов для справочников.
+
+    ETag и Last-Modified строятся по версии набора данных
+    `version_name`, которая меняется при сохранении и удалении
+    объектов. На совпадающий If-None-Match отдаётся 304 без обращения
+    к базе и сериализатору, остальные ответы берутся из кэша, пока
+    версия не изменится.
+    """
+
+    version_name = None
+
+    def list(self, request, *args, **kwargs):
+        return self.versioned_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.versioned_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def versioned_response(self, handler, request, *args, **kwargs):
+        version = get_version(self.version_name)
+        etag = quote_etag(
+            f'{self.version_name}-{version}-'
+            f'{request.accepted_renderer.format}'
+        )
+        last_modified = version // 10 ** 9
+
+        if self.is_not_modified(request, etag, last_modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            key = (
+                f'response:{self.version_name}:{version}:'
+                f'{request.get_full_path()}'
+            )
+            data = cache.get(key)
+            if data is None:
+                response = handler(request, *args, **kwargs)
+                if response.status_code == status.HTTP_200_OK:
+                    cache.set(
+                        key, response.data,
+                        constants.REFERENCE_DATA_CACHE_TIMEOUT
+                    )
+            else:
+                response = Response(data)
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def is_not_modified(self, request, etag, last_modified):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            etags = parse_etags(if_none_match)
+            return '*' in etags or etag in etags
+        # Last-Modified точен до секунды, а версия может смениться в ту же
+        # секунду, что и отданный ответ, поэтому 304 только для версий
+        # строго старше If-Modified-Since. Точное сравнение даёт ETag.
+        if_modified_since = parse_http_date_safe(
+            request.META.get('HTTP_IF_MODIFIED_SINCE', '')
+        )
+        return (if_modified_since is not None
+                and last_modified < if_modified_since)
+
+
+class RecipeRepresentationCache:
+    """
+    Кэш представлений рецептов, общих для всех пользователей.
+
+    Тело рецепта хранится по ключу из id и версий рецепта, автора,
+    тегов и ингредиентов. Флаги текущего пользователя (is_favorited,
+    is_in_shopping_cart и author.is_subscribed) подставляются при
+    каждом ответе из множеств api.memberships.
+    """
+
+    def __init__(self, request):
+        self.prefix = f'recipe-body:{request.scheme}://{request.get_host()}'
+
+    def get_keys(self, recipes):
+        names = {versions.TAGS, versions.INGREDIENTS}
+        for recipe in recipes:
+            names.add(versions.RECIPE.format(recipe.pk))
+            names.add(versions.USER.format(recipe.author_id))
+        current = versions.get_versions(names)
+        shared = (
+            f'{current[versions.TAGS]}:{current[versions.INGREDIENTS]}'
+        )
+        return {
+            recipe.pk: (
+                f'{self.prefix}:{recipe.pk}:'
+                f'{current[versions.RECIPE.format(recipe.pk)]}:'
+                f'{current[versions.USER.format(recipe.author_id)]}:'
+                f'{shared}'
+            )
+            for recipe in recipes
+        }
+
+    def get_many(self, keys):
+        """Возвращает {id рецепта: тело} для найденных в кэше."""
+        found = cache.get_many(keys.values())
+        return {
+            pk: found[key] for pk, key in keys.items() if key in found
+        }
+
+    def set_many(self, keys, bodies):
+        cache.set_many(
+            {keys[pk]: body for pk, body in bodies.items()},
+            constants.RECIPE_CACHE_TIMEOUT
+        )
+
+    @staticmethod
+    def overlay(body, recipe, memberships):
+        """Подставляет в общее тело флаги текущего пользователя."""
+        body = dict(body)
+        body['author'] = dict(
+            body['author'],
+            is_subscribed=recipe.author_id in memberships.subscriptions
+        )
+        body['is_favorited'] = recipe.pk in memberships.favorites
+        body['is_in_shopping_cart'] = recipe.pk in memberships.shopping_cart
+        return body
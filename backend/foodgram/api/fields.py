@@ -0,0 +1,179 @@
+import base64
+import binascii
+import logging
+import uuid
+from tempfile import SpooledTemporaryFile
+
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+from recipes import constants
+
+logger = logging.getLogger(__name__)
+
+IMAGE_FORMATS = {
+    'JPEG': ('jpg', 'image/jpeg'),
+    'PNG': ('png', 'image/png'),
+    'GIF': ('gif', 'image/gif'),
+}
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def process_image(source):
+    """
+    Проверяет изображение и перекодирует его в тот же формат.
+
+    Размеры читаются из заголовка до декодирования пикселей, поэтому
+    слишком большие картинки отклоняются без выделения памяти под них.
+    Возвращает (файл, формат, ширина, высота, число кадров).
+    """
+    with Image.open(source) as image:
+        image_format = image.format
+        width, height = image.size
+        frames = getattr(image, 'n_frames', 1)
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(image_format)
+        if width * height * frames > constants.IMAGE_MAX_PIXELS:
+            raise ImageTooLarge(width * height * frames)
+        image.verify()
+
+    source.seek(0)
+    output = SpooledTemporaryFile(max_size=constants.IMAGE_SPOOL_SIZE)
+    with Image.open(source) as image:
+        options = {}
+        if image_format == 'JPEG':
+            options['quality'] = 'keep'
+        elif image_format == 'GIF' and frames > 1:
+            options['save_all'] = True
+        image.save(output, format=image_format, **options)
+    output.seek(0)
+    return output, image_format, width, height, frames
+
+
+class BoundedBase64ImageField(serializers.ImageField):
+    """
+    Картинка в base64 с ограничением памяти.
+
+    Строка декодируется частями во временный файл, который остаётся
+    в памяти только до IMAGE_SPOOL_SIZE. Размер файла и число пикселей
+    проверяются до полного декодирования, поэтому работа Pillow в потоке
+    запроса ограничена IMAGE_MAX_BYTES и IMAGE_MAX_PIXELS.
+    """
+
+    default_error_messages = {
+        'invalid_image': 'Загрузите корректное изображение.',
+        'too_large': (
+            'Размер изображения не должен превышать {max_bytes} байт.'
+        ),
+        'too_many_pixels': (
+            'Изображение не должно быть больше {max_pixels} пикселей.'
+        ),
+    }
+
+    def to_internal_value(self, data):
+        if not data:
+            return None
+        if not isinstance(data, str):
+            self.fail('invalid_image')
+
+        start = data.find(';base64,')
+        start = start + len(';base64,') if start != -1 else 0
+        if (len(data) - start) * 3 // 4 > constants.IMAGE_MAX_BYTES:
+            self.fail('too_large', max_bytes=constants.IMAGE_MAX_BYTES)
+
+        source = self.decode(data, start)
+        size = source.tell()
+        source.seek(0)
+        try:
+            output, image_format, width, height, frames = (
+                process_image(source)
+            )
+        except ImageTooLarge:
+            self.fail(
+                'too_many_pixels', max_pixels=constants.IMAGE_MAX_PIXELS
+            )
+        except Exception:
+            self.fail('invalid_image')
+        finally:
+            source.close()
+
+        extension, content_type = IMAGE_FORMATS[image_format]
+        output_size = output.seek(0, 2)
+        output.seek(0)
+        logger.info(
+            'Изображение %s %dx%d (%d кадров): %d байт на входе, '
+            '%d на выходе, пиковая память не более %d байт',
+            image_format, width, height, frames, size, output_size,
+            min(size, constants.IMAGE_SPOOL_SIZE)
+            + min(output_size, constants.IMAGE_SPOOL_SIZE)
+            + width * height * frames * 4
+        )
+        return UploadedFile(
+            file=output,
+            name=f'{uuid.uuid4()}.{extension}',
+            content_type=content_type,
+            size=output_size,
+        )
+
+    def decode(self, data, start):
+        """Декодирует base64 частями во временный файл."""
+        source = SpooledTemporaryFile(max_size=constants.IMAGE_SPOOL_SIZE)
+        chunk_size = constants.IMAGE_BASE64_CHUNK_SIZE
+        try:
+            for offset in range(start, len(data), chunk_size):
+                source.write(base64.b64decode(
+                    data[offset:offset + chunk_size], validate=True
+                ))
+        except (binascii.Error, ValueError):
+            source.close()
+            self.fail('invalid_image')
+        return source
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """Список первичных ключей, который проверяется одним запросом IN."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        pk_field = self.child_relation.pk_field
+        pks = []
+        for item in data:
+            if isinstance(item, bool):
+                self.child_relation.fail(
+                    'incorrect_type', data_type=type(item).__name__
+                )
+            try:
+                pks.append(
+                    pk_field.to_internal_value(item) if pk_field
+                    else int(item)
+                )
+            except (TypeError, ValueError):
+                self.child_relation.fail(
+                    'incorrect_type', data_type=type(item).__name__
+                )
+        objects = self.child_relation.get_queryset().in_bulk(pks)
+        for pk in pks:
+            if pk not in objects:
+                self.child_relation.fail('does_not_exist', pk_value=pk)
+        return [objects[pk] for pk in pks]
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField, у которого many=True проверяет id пачкой."""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
@@ -1,7 +1,19 @@
 import django_filters
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from recipes.search import search_recipes
+
+# Порядок с id в конце, чтобы он был однозначным и шёл по индексу.
+RECIPE_ORDERINGS = {
+    'pub_date': ('pub_date', 'id'),
+    '-pub_date': ('-pub_date', '-id'),
+    'favorites_count': ('favorites_count', 'id'),
+    '-favorites_count': ('-favorites_count', '-id'),
+    'shopping_cart_count': ('shopping_cart_count', 'id'),
+    '-shopping_cart_count': ('-shopping_cart_count', '-id'),
+}
 
 
 class IngredientFilter(django_filters.FilterSet):
@@ -27,17 +39,43 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='get_search')
+    ordering = filters.ChoiceFilter(
+        choices=[(value, value) for value in RECIPE_ORDERINGS],
+        method='get_ordering'
+    )
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+            'search', 'ordering',
+        )
 
     def get_is_favorited(self, queryset, name, value):
         if value:
-            return queryset.filter(favorites__user=self.request.user.id)
+            return queryset.filter(self.is_member(Favorite))
         return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         if value:
-            return queryset.filter(shopping_carts__user=self.request.user.id)
+            return queryset.filter(self.is_member(ShoppingCart))
+        return queryset
+
+    def is_member(self, model):
+        """
+        EXISTS по индексу связи пользователь-рецепт. Множества из
+        get_memberships подходят для флагов в ответе, но в запросе
+        превратились бы в IN-список неограниченной длины.
+        """
+        return Exists(model.objects.filter(
+            user_id=self.request.user.id, recipe_id=OuterRef('pk')
+        ))
+
+    def get_search(self, queryset, name, value):
+        if value.strip():
+            return search_recipes(queryset, value.strip())
         return queryset
+
+    def get_ordering(self, queryset, name, value):
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
@@ -0,0 +1,95 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from recipes import constants
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscription, User
+
+FAVORITES = 'favorites'
+SHOPPING_CART = 'shopping_cart'
+SUBSCRIPTIONS = 'subscriptions'
+
+SOURCES = {
+    FAVORITES: (Favorite, 'recipe_id'),
+    SHOPPING_CART: (ShoppingCart, 'recipe_id'),
+    SUBSCRIPTIONS: (Subscription, 'author_id'),
+}
+
+
+class UserMemberships:
+    """
+    Множества id избранных рецептов, рецептов в корзине и авторов,
+    на которых подписан пользователь.
+
+    Каждое множество загружается одним запросом и хранится в кэше
+    Django. Действия, меняющие избранное, корзину и подписки, сбрасывают
+    соответствующее множество через `changed`. Сброс в кэше процесса
+    не дошёл бы до других воркеров, поэтому без общего кэша множества
+    живут только до конца запроса.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._sets = {}
+
+    @staticmethod
+    def cache_key(user_id, kind):
+        return f'memberships:{user_id}:{kind}'
+
+    def get(self, kind):
+        if not self.user.is_authenticated:
+            return frozenset()
+        if kind not in self._sets:
+            key = self.cache_key(self.user.pk, kind)
+            ids = cache.get(key) if settings.SHARED_CACHE else None
+            if ids is None:
+                model, field = SOURCES[kind]
+                ids = frozenset(model.objects.filter(
+                    user=self.user
+                ).order_by().values_list(field, flat=True))
+                if settings.SHARED_CACHE:
+                    cache.set(key, ids, constants.MEMBERSHIP_CACHE_TIMEOUT)
+            self._sets[kind] = ids
+        return self._sets[kind]
+
+    def changed(self, kind):
+        self._sets.pop(kind, None)
+        if settings.SHARED_CACHE:
+            key = self.cache_key(self.user.pk, kind)
+            transaction.on_commit(lambda: cache.delete(key))
+
+    @property
+    def favorites(self):
+        return self.get(FAVORITES)
+
+    @property
+    def shopping_cart(self):
+        return self.get(SHOPPING_CART)
+
+    @property
+    def subscriptions(self):
+        return self.get(SUBSCRIPTIONS)
+
+
+def lock_memberships(user_id):
+    """
+    Блокирует строку пользователя до конца транзакции.
+
+    Её берут все изменения избранного, корзины и подписок, поэтому
+    прочитанные под блокировкой связи не меняются до вставки или
+    удаления, а счётчики и списки покупок обновляются только для
+    реально добавленных и удалённых связей.
+    """
+    list(User.objects.select_for_update().filter(
+        pk=user_id
+    ).values_list('pk', flat=True))
+
+
+def get_memberships(request):
+    """Множества текущего пользователя, общие на весь запрос."""
+    memberships = getattr(request, '_memberships', None)
+    if memberships is None or memberships.user != request.user:
+        memberships = UserMemberships(request.user)
+        request._memberships = memberships
+    return memberships
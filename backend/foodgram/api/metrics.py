@@ -0,0 +1,222 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+class RequestMetrics:
+    """Счётчики одного запроса."""
+
+    __slots__ = (
+        'view', 'queries', 'sql_time', 'serializer_time', 'depth', 'started'
+    )
+
+    def __init__(self):
+        self.view = None
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.depth = 0
+        self.started = time.perf_counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        """Обёртка для `connection.execute_wrapper`."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries += 1
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series.setdefault(
+                labels, [[0] * (len(self.buckets) + 1), 0.0]
+            )
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def expose(self):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, (counts, total) in sorted(self.series.items()):
+            label = ','.join(f'{key}="{value}"' for key, value in labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                yield (
+                    f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}'
+                )
+            yield f'{self.name}_sum{{{label}}} {total}'
+            yield f'{self.name}_count{{{label}}} {cumulative}'
+
+
+class Registry:
+    """
+    Гистограммы по представлениям в памяти процесса.
+    Каждый воркер gunicorn отдаёт свои значения.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.duration = Histogram(
+            'foodgram_request_duration_seconds',
+            'Время обработки запроса.', DURATION_BUCKETS
+        )
+        self.queries = Histogram(
+            'foodgram_request_sql_queries',
+            'Число SQL-запросов на запрос.', QUERY_BUCKETS
+        )
+        self.sql_time = Histogram(
+            'foodgram_request_sql_duration_seconds',
+            'Время SQL-запросов на запрос.', DURATION_BUCKETS
+        )
+        self.serializer_time = Histogram(
+            'foodgram_request_serializer_duration_seconds',
+            'Время сериализации на запрос.', DURATION_BUCKETS
+        )
+        self.size = Histogram(
+            'foodgram_response_size_bytes',
+            'Размер тела ответа.', SIZE_BUCKETS
+        )
+
+    def record(self, metrics, method, status, duration, size):
+        labels = (('view', metrics.view), ('method', method))
+        with self.lock:
+            self.duration.observe(
+                labels + (('status', str(status)),), duration
+            )
+            self.queries.observe(labels, metrics.queries)
+            self.sql_time.observe(labels, metrics.sql_time)
+            self.serializer_time.observe(labels, metrics.serializer_time)
+            if size is not None:
+                self.size.observe(labels, size)
+
+    def expose(self):
+        with self.lock:
+            lines = [
+                line
+                for histogram in (
+                    self.duration, self.queries, self.sql_time,
+                    self.serializer_time, self.size,
+                )
+                for line in histogram.expose()
+            ]
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Обёртка `execute_wrapper`, которая есть у каждого соединения и
+    пишет запрос в метрики текущего запроса, если они есть. Метрики
+    берутся из контекстной переменной, поэтому учитываются и запросы
+    из потоков sync_to_async, и запросы при чтении потокового ответа.
+    """
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def install_query_metrics(connection, **kwargs):
+    """Обработчик сигнала connection_created."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def timed_serialization(method):
+    """
+    Учитывает время вызова метода сериализатора в метриках запроса.
+    Вложенные вызовы не суммируются повторно.
+    """
+
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        metrics = current_metrics.get()
+        if metrics is None or metrics.depth:
+            return method(*args, **kwargs)
+        metrics.depth += 1
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            metrics.serializer_time += time.perf_counter() - started
+            metrics.depth -= 1
+
+    return wrapper
+
+
+timed_classes = {}
+
+
+def timed_serializer_class(serializer_class):
+    """Подкласс сериализатора, который замеряет `to_representation`."""
+    timed = timed_classes.get(serializer_class)
+    if timed is None:
+        timed = timed_classes.setdefault(serializer_class, type(
+            serializer_class.__name__, (serializer_class,), {
+                '__module__': serializer_class.__module__,
+                'to_representation': timed_serialization(
+                    serializer_class.to_representation
+                ),
+            }
+        ))
+    return timed
+
+
+class SerializerMetricsMixin:
+    """
+    Учитывает в метриках время сериализации ответов вьюсета.
+    Сериализаторы, которые действия создают сами, оборачиваются
+    через `timed`.
+    """
+
+    def get_serializer_class(self):
+        return timed_serializer_class(super().get_serializer_class())
+
+    @staticmethod
+    def timed(serializer_class):
+        return timed_serializer_class(serializer_class)
+
+
+def metrics_view(request):
+    """
+    Метрики в текстовом формате Prometheus. Доступны администраторам
+    и по токену METRICS_TOKEN в заголовке Authorization.
+    """
+    token = settings.METRICS_TOKEN
+    if not request.user.is_staff and not (token and constant_time_compare(
+        request.headers.get('Authorization', ''), f'Bearer {token}'
+    )):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        registry.expose(), content_type='text/plain; version=0.0.4'
+    )
+
+
+metrics_view.skip_metrics = True
@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+from api.metrics import RequestMetrics, current_metrics, registry
+
+
+def get_view_name(view_func):
+    """Имя вида `RecipeViewSet.list` для вьюсетов DRF."""
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return getattr(view_func, '__name__', 'unknown')
+    return view_class.__name__
+
+
+def measured_stream(content, metrics, method, status):
+    """
+    Отдаёт потоковое тело ответа, учитывая в метриках запросы к базе,
+    сделанные при его формировании. Запрос записывается в гистограммы
+    после того, как тело отдано целиком или клиент отключился.
+    """
+    size = 0
+    iterator = iter(content)
+    try:
+        while True:
+            token = current_metrics.set(metrics)
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                current_metrics.reset(token)
+            size += len(chunk)
+            yield chunk
+    finally:
+        registry.record(
+            metrics, method, status, time.perf_counter() - metrics.started,
+            size
+        )
+
+
+class MetricsMiddleware:
+    """
+    Замеряет время ответа, число и время SQL-запросов, время
+    сериализации и размер ответа, добавляет заголовок Server-Timing
+    и пишет значения в гистограммы для `/api/metrics/`.
+
+    Работает и в WSGI, и в ASGI. Запросы к базе считает обёртка
+    record_query, установленная на каждом соединении.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Так Django 3.2 отличает асинхронные middleware.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        if metrics.view is None:
+            return response
+        if response.streaming:
+            response.streaming_content = measured_stream(
+                response.streaming_content, metrics, request.method,
+                response.status_code
+            )
+            return response
+
+        duration = time.perf_counter() - metrics.started
+        response['Server-Timing'] = (
+            f'total;dur={duration * 1000:.1f}, '
+            f'db;dur={metrics.sql_time * 1000:.1f};'
+            f'desc="{metrics.queries} queries", '
+            f'serializer;dur={metrics.serializer_time * 1000:.1f}'
+        )
+        registry.record(
+            metrics, request.method, response.status_code, duration,
+            len(response.content)
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = current_metrics.get()
+        if metrics is None or getattr(view_func, 'skip_metrics', False):
+            return None
+        name = get_view_name(view_func)
+        actions = getattr(view_func, 'actions', None)
+        if actions:
+            action = actions.get(request.method.lower())
+            name = f'{name}.{action or request.method.lower()}'
+        metrics.view = name
+        return None
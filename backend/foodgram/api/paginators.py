@@ -1,5 +1,186 @@
-from rest_framework.pagination import PageNumberPagination
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from recipes.models import Recipe
 
 
 class PageLimitPagination(PageNumberPagination):
     page_size_query_param = "limit"
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по курсору для ленты рецептов.
+
+    Рецепты упорядочены по (-pub_date, -id), следующая страница
+    выбирается условием по последней паре значений вместо OFFSET,
+    а общее количество не считается. Курсор — base64 от
+    "pub_date|id|направление".
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = api_settings.PAGE_SIZE
+    invalid_cursor_message = 'Неверный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_size, position, reverse = self.start(request)
+        queryset = self.after_position(queryset, position, reverse)
+        return self.set_page(
+            list(queryset[:page_size + 1]), page_size, position, reverse
+        )
+
+    def start(self, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        return (self.get_page_size(request), *self.decode_cursor(request))
+
+    def after_position(self, queryset, position, reverse,
+                       date_field='pub_date', id_field='id'):
+        """Упорядочивает кверисет и оставляет строки после курсора."""
+        if reverse:
+            queryset = queryset.order_by(date_field, id_field)
+        else:
+            queryset = queryset.order_by(f'-{date_field}', f'-{id_field}')
+        if position:
+            pub_date, pk = position
+            after = 'gt' if reverse else 'lt'
+            queryset = queryset.filter(
+                Q(**{f'{date_field}__{after}': pub_date})
+                | Q(**{date_field: pub_date, f'{id_field}__{after}': pk})
+            )
+        return queryset
+
+    def set_page(self, results, page_size, position, reverse):
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return page_size if page_size > 0 else self.page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            pub_date, pk, reverse = b64decode(
+                encoded.encode('ascii')
+            ).decode('ascii').split('|')
+            pub_date = parse_datetime(pub_date)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if pub_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return (pub_date, pk), reverse == '1'
+
+    def encode_cursor(self, recipe, reverse):
+        cursor = f'{recipe.pub_date.isoformat()}|{recipe.pk}|{int(reverse)}'
+        return replace_query_param(
+            self.base_url, self.cursor_query_param,
+            b64encode(cursor.encode('ascii')).decode('ascii')
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+
+class FeedPagination(KeysetPagination):
+    """
+    Курсорная пагинация ленты подписок, собранной из нескольких
+    источников. Каждый источник — кверисет с полями даты публикации,
+    id рецепта и id автора; из каждого берётся не больше страницы
+    после курсора, и результаты сливаются по (pub_date, id).
+    """
+
+    def paginate_sources(self, sources, request):
+        page_size, position, reverse = self.start(request)
+        recipes = {}
+        for queryset, date_field, id_field, author_field in sources:
+            rows = self.after_position(
+                queryset, position, reverse, date_field, id_field
+            ).values_list(date_field, id_field, author_field)
+            for pub_date, pk, author_id in rows[:page_size + 1]:
+                recipes[pk] = Recipe(
+                    pk=pk, pub_date=pub_date, author_id=author_id
+                )
+        results = sorted(
+            recipes.values(),
+            key=lambda recipe: (recipe.pub_date, recipe.pk),
+            reverse=not reverse
+        )
+        return self.set_page(
+            results[:page_size + 1], page_size, position, reverse
+        )
+
+
+class RecipePagination(PageLimitPagination):
+    """
+    По умолчанию пагинация по номеру страницы с полями
+    count/next/previous/results. Параметр `cursor` (в том числе пустой)
+    включает KeysetPagination; она задаёт свой порядок, поэтому
+    результаты поиска с курсором идут по дате, а не по релевантности,
+    а другой `ordering` вместе с курсором отклоняется.
+    """
+
+    keyset_ordering = '-pub_date'
+    invalid_ordering_message = (
+        'С параметром cursor доступна только сортировка -pub_date.'
+    )
+
+    def __init__(self):
+        self.keyset = KeysetPagination()
+        self.use_keyset = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_keyset = (
+            self.keyset.cursor_query_param in request.query_params
+        )
+        if self.use_keyset:
+            ordering = request.query_params.get('ordering')
+            if ordering and ordering != self.keyset_ordering:
+                raise ValidationError(
+                    {'ordering': [self.invalid_ordering_message]}
+                )
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.use_keyset:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
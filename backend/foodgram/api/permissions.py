@@ -18,4 +18,4 @@ class Author(BasePermission):
         """
 
         return (request.method in permissions.SAFE_METHODS
-                or obj.author == request.user)
+                or obj.author_id == request.user.id)
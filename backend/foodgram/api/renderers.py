@@ -0,0 +1,161 @@
+import csv
+import io
+import json
+import os
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.renderers import BaseRenderer
+
+from recipes import constants
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """
+    Базовый рендерер списка покупок.
+
+    Строки списка (словари с ключами `ingredient__name`,
+    `ingredient__measurement_unit` и `total_amount`) превращаются
+    в файл по частям, чтобы его можно было отдать через
+    StreamingHttpResponse.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            # Ошибки (например, 401) приходят словарём.
+            return json.dumps(data, ensure_ascii=False).encode(self.charset)
+        return b''.join(self.stream(data))
+
+    @property
+    def content_type(self):
+        if self.charset:
+            return f'{self.media_type}; charset={self.charset}'
+        return self.media_type
+
+    def stream(self, ingredients):
+        """Генератор байтовых частей файла."""
+        buffer = io.StringIO()
+        for line in self.lines(ingredients):
+            buffer.write(line)
+            if buffer.tell() >= constants.SHOPPING_LIST_BUFFER_SIZE:
+                yield buffer.getvalue().encode(self.charset)
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode(self.charset)
+
+    def lines(self, ingredients):
+        raise NotImplementedError(
+            'ShoppingListRenderer.lines() must be implemented.'
+        )
+
+
+class ShoppingListTxtRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def lines(self, ingredients):
+        for ingredient in ingredients:
+            name = ingredient['ingredient__name']
+            total_amount = ingredient['total_amount']
+            measurement_unit = ingredient['ingredient__measurement_unit']
+            yield f"{name} - {total_amount} {measurement_unit} \n"
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def lines(self, ingredients):
+        line = io.StringIO()
+        writer = csv.writer(line)
+        writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
+        for ingredient in ingredients:
+            yield line.getvalue()
+            line.seek(0)
+            line.truncate()
+            writer.writerow((
+                ingredient['ingredient__name'],
+                ingredient['total_amount'],
+                ingredient['ingredient__measurement_unit'],
+            ))
+        yield line.getvalue()
+
+
+class ShoppingListPDFRenderer(ShoppingListRenderer):
+    """
+    Список покупок в PDF, разбитый на страницы A4.
+
+    ReportLab собирает документ целиком перед записью, поэтому PDF
+    отдаётся частями только после построения. Размер списка ограничен
+    числом ингредиентов в справочнике, а не числом рецептов в корзине.
+    """
+
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = [
+                {
+                    'ingredient__name': f'{key}: {value}',
+                    'total_amount': '',
+                    'ingredient__measurement_unit': '',
+                }
+                for key, value in data.items()
+            ]
+        return b''.join(self.stream(data))
+
+    def get_font_name(self):
+        font_path = settings.SHOPPING_LIST_PDF_FONT
+        if font_path and os.path.exists(font_path):
+            registered = pdfmetrics.getRegisteredFontNames()
+            if constants.PDF_FONT_NAME not in registered:
+                pdfmetrics.registerFont(
+                    TTFont(constants.PDF_FONT_NAME, font_path)
+                )
+            return constants.PDF_FONT_NAME
+        return 'Helvetica'
+
+    def stream(self, ingredients):
+        output = io.BytesIO()
+        font_name = self.get_font_name()
+        width, height = A4
+        document = canvas.Canvas(output, pagesize=A4)
+        document.setTitle('Список покупок')
+        page = 1
+        top = height - constants.PDF_MARGIN
+        bottom = constants.PDF_MARGIN
+        y = top
+        for line in ShoppingListTxtRenderer().lines(ingredients):
+            if y < bottom:
+                self.draw_page_number(document, font_name, page, width)
+                document.showPage()
+                page += 1
+                y = top
+            document.setFont(font_name, constants.PDF_FONT_SIZE)
+            document.drawString(constants.PDF_MARGIN, y, line.rstrip())
+            y -= constants.PDF_LINE_HEIGHT
+        self.draw_page_number(document, font_name, page, width)
+        document.save()
+
+        output.seek(0)
+        while True:
+            chunk = output.read(constants.SHOPPING_LIST_BUFFER_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+    def draw_page_number(self, document, font_name, page, width):
+        document.setFont(font_name, constants.PDF_FONT_SIZE - 2)
+        document.drawRightString(
+            width - constants.PDF_MARGIN, constants.PDF_MARGIN / 2,
+            f'Стр. {page}'
+        )
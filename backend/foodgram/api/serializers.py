@@ -1,13 +1,15 @@
+from django.db import transaction
 from djoser.serializers import (
     UserCreateSerializer as UserCreateSerializerDjoser
 )
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
+from api.fields import BoundedBase64ImageField, BulkPrimaryKeyRelatedField
+from api.memberships import get_memberships
 from recipes import constants
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+                            RecipeTag, ShoppingCart, ShoppingListItem, Tag)
 from users.models import Subscription, User
 
 
@@ -18,10 +20,14 @@ class IsSubscribedMixin(metaclass=serializers.SerializerMetaclass):
         """
         Подписан ли текущий пользователь на переданного.
         obj - объект автора.
+        Если флаг уже посчитан в кверисете, используется он, иначе
+        ответ берётся из закэшированного множества подписок.
         """
-        current_user = self.context.get('request').user
-        return (current_user.is_authenticated
-                and obj.subscribing.filter(user=current_user).exists())
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        request = self.context.get('request')
+        return (request is not None
+                and obj.pk in get_memberships(request).subscriptions)
 
 
 class UserCreateSerializer(UserCreateSerializerDjoser):
@@ -61,28 +67,49 @@ class RecipeUserSerializer(UserSerializer, serializers.ModelSerializer):
         model = User
         fields = UserSerializer.Meta.fields + ('recipes', 'recipes_count')
 
+    @staticmethod
+    def parse_recipes_limit(request):
+        """
+        Разбирает параметр `recipes_limit` из запроса.
+        Возвращает None, если параметр не передан или равен нулю.
+        """
+        recipes_limit = request.query_params.get('recipes_limit')
+        if not recipes_limit:
+            return None
+        try:
+            recipes_limit = int(recipes_limit)
+        except ValueError:
+            raise serializers.ValidationError(
+                'Не целое число', code='error'
+            )
+        if recipes_limit < 0:
+            raise serializers.ValidationError(
+                'Число не может быть отрицательным', code='error'
+            )
+        return recipes_limit or None
+
+    def get_recipes_limit(self):
+        if 'recipes_limit' not in self.context:
+            request = self.context.get('request')
+            self.context['recipes_limit'] = (
+                self.parse_recipes_limit(request) if request else None
+            )
+        return self.context['recipes_limit']
+
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        recipes_limit = None
-
-        if request:
-            recipes_limit_param = request.query_params.get('recipes_limit')
-            if recipes_limit_param:
-                try:
-                    recipes_limit = int(recipes_limit_param)
-                except ValueError:
-                    raise serializers.ValidationError(
-                        'Не целое число', code='error'
-                    )
-        recipes = obj.recipes.all()
-
-        if recipes_limit:
-            recipes = recipes[:int(recipes_limit)]
+        recipes = getattr(obj, 'latest_recipes', None)
+        if recipes is None:
+            recipes_limit = self.get_recipes_limit()
+            recipes = obj.recipes.all()
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
 
         serializer = RecipeSerializer(recipes, many=True, context=self.context)
         return serializer.data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
 
@@ -143,9 +170,9 @@ class RecipeIngredientReadSerializer(serializers.ModelSerializer):
 
 
 class RecipeIngredientWriteSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(), source='ingredient'
-    )
+    # Существование ингредиентов проверяется одним запросом
+    # в RecipeWriteSerializer.validate_ingredients.
+    id = serializers.IntegerField(source='ingredient')
     amount = serializers.IntegerField(
         max_value=constants.MAX_INGREDIENT_AMOUNT,
         min_value=constants.MIN_INGREDIENT_AMOUNT
@@ -177,26 +204,22 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     def get_is_favorited(self, obj):
         request = self.context.get('request')
         return (request is not None
-                and request.user.is_authenticated
-                and request.user.favorites.filter(recipe=obj).exists()
-                )
+                and obj.pk in get_memberships(request).favorites)
 
     def get_is_in_shopping_cart(self, obj):
         request = self.context.get('request')
         return (request is not None
-                and request.user.is_authenticated
-                and request.user.shopping_carts.filter(recipe=obj).exists()
-                )
+                and obj.pk in get_memberships(request).shopping_cart)
 
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
     ingredients = RecipeIngredientWriteSerializer(
         many=True
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         many=True, queryset=Tag.objects.all()
     )
-    image = Base64ImageField()
+    image = BoundedBase64ImageField()
 
     class Meta:
         model = Recipe
@@ -238,41 +261,141 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             )
         return data
 
-    def create_or_update_ingredients(self, ingredients, recipe):
-        recipe_ingredients = [
-            RecipeIngredient(
-                recipe=recipe,
-                ingredient=ingredient.get('ingredient'),
-                amount=ingredient.get('amount')
-            )
+    def validate_ingredients(self, ingredients):
+        ids = [ingredient['ingredient'] for ingredient in ingredients]
+        found = Ingredient.objects.in_bulk(ids)
+        errors = [
+            {} if pk in found else {'id': [
+                serializers.PrimaryKeyRelatedField.default_error_messages[
+                    'does_not_exist'
+                ].format(pk_value=pk)
+            ]}
+            for pk in ids
+        ]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return [
+            {
+                'ingredient': found[ingredient['ingredient']],
+                'amount': ingredient['amount'],
+            }
             for ingredient in ingredients
         ]
-        RecipeIngredient.objects.bulk_create(recipe_ingredients)
 
+    @staticmethod
+    def set_prefetched(instance, name, objects):
+        """
+        Кладёт уже известные связанные объекты в кэш prefetch,
+        чтобы ответ строился без повторных запросов.
+        """
+        queryset = getattr(instance, name).all()
+        queryset._result_cache = list(objects)
+        queryset._prefetch_done = True
+        if not hasattr(instance, '_prefetched_objects_cache'):
+            instance._prefetched_objects_cache = {}
+        instance._prefetched_objects_cache[name] = queryset
+
+    def set_tags(self, recipe, tags, current=()):
+        tags = sorted(tags, key=lambda tag: tag.name)
+        removed = set(current) - {tag.id for tag in tags}
+        if removed:
+            RecipeTag.objects.filter(
+                recipe=recipe, tag_id__in=removed
+            ).delete()
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe=recipe, tag=tag)
+            for tag in tags if tag.id not in current
+        )
+        self.set_prefetched(recipe, 'tags', tags)
+
+    def set_ingredients(self, recipe, ingredients, current=None):
+        """
+        Приводит ингредиенты рецепта к переданным: удаляет лишние,
+        меняет количество у изменившихся и добавляет новые.
+        Возвращает изменения количества {id ингредиента: разница}.
+        """
+        current = current or {}
+        new = {
+            ingredient['ingredient'].id: ingredient
+            for ingredient in ingredients
+        }
+        removed = [pk for pk in current if pk not in new]
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+
+        changed = []
+        created = []
+        for pk, ingredient in new.items():
+            recipe_ingredient = current.get(pk)
+            if recipe_ingredient is None:
+                created.append(RecipeIngredient(
+                    recipe=recipe,
+                    ingredient=ingredient['ingredient'],
+                    amount=ingredient['amount']
+                ))
+            elif recipe_ingredient.amount != ingredient['amount']:
+                changed.append(recipe_ingredient)
+        deltas = {pk: -current[pk].amount for pk in removed}
+        deltas.update({
+            item.ingredient_id: new[item.ingredient_id]['amount'] - item.amount
+            for item in changed
+        })
+        deltas.update({item.ingredient_id: item.amount for item in created})
+
+        for item in changed:
+            item.amount = new[item.ingredient_id]['amount']
+        RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        RecipeIngredient.objects.bulk_create(created)
+
+        kept = sorted(
+            (item for pk, item in current.items() if pk in new),
+            key=lambda item: item.pk
+        )
+        for item in kept:
+            item.ingredient = new[item.ingredient_id]['ingredient']
+        self.set_prefetched(recipe, 'recipes_ingredients', kept + created)
+        return deltas
+
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context.get('request').user
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
 
         recipe = Recipe.objects.create(**validated_data, author=author)
-        recipe.tags.set(tags)
-
-        self.create_or_update_ingredients(
-            ingredients=ingredients, recipe=recipe
-        )
+        self.set_tags(recipe, tags)
+        self.set_ingredients(recipe, ingredients)
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients_valid = validated_data.pop('ingredients', None)
         tags_valid = validated_data.pop('tags', None)
-        instance.tags.set(tags_valid)
-        instance.ingredients.clear()
+        Recipe.objects.select_for_update().filter(pk=instance.pk).exists()
 
-        self.create_or_update_ingredients(
-            ingredients=ingredients_valid, recipe=instance
-        )
+        if tags_valid is not None:
+            self.set_tags(instance, tags_valid, set(
+                instance.recipes_tags.order_by().values_list(
+                    'tag_id', flat=True
+                )
+            ))
+        if ingredients_valid is not None:
+            deltas = self.set_ingredients(instance, ingredients_valid, {
+                item.ingredient_id: item
+                for item in instance.recipes_ingredients.all()
+            })
+            if deltas:
+                ShoppingListItem.objects.apply_deltas(
+                    instance.shopping_carts.values_list('user_id', flat=True),
+                    deltas
+                )
 
+        user = self.context.get('request').user
+        if instance.author_id == user.id:
+            instance.author = user
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
@@ -311,3 +434,15 @@ class ShoppingCartWriteSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         return RecipeSerializer(instance.recipe, context=self.context).data
+
+
+class BulkIdsSerializer(serializers.Serializer):
+    """Список id для массовых операций, без повторов и в исходном порядке."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False, max_length=constants.BULK_MAX_ITEMS
+    )
+
+    def validate_ids(self, ids):
+        return list(dict.fromkeys(ids))
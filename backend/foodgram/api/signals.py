@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import forget_tokens
+from users.models import User
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(instance, **kwargs):
+    forget_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def user_saved(instance, **kwargs):
+    forget_tokens(Token.objects.filter(user=instance).values_list(
+        'key', flat=True
+    ))
@@ -1,6 +1,8 @@
-from django.urls import include, path
+from django.conf import settings
+from django.urls import include, path, re_path
 from rest_framework.routers import DefaultRouter
 
+from api.metrics import metrics_view
 from api.views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
 
 app_name = 'api'
@@ -21,5 +23,21 @@ router_v1.register(
 
 urlpatterns = [
     path('auth/', include('djoser.urls.authtoken')),
+    path('metrics/', metrics_view, name='metrics'),
+]
+
+if settings.ASYNC_VIEWS:
+    from api import async_views
+
+    urlpatterns += [
+        re_path(
+            r'^recipes/download_shopping_cart(?:\.(?P<format>[a-z0-9]+))?/?$',
+            async_views.download_shopping_cart,
+        ),
+        path('tags/', async_views.tag_list),
+        path('ingredients/', async_views.ingredient_list),
+    ]
+
+urlpatterns += [
     path('', include(router_v1.urls)),
 ]
@@ -1,5 +1,6 @@
-from django.db.models import Sum
-from django.http import Http404, HttpResponse
+from django.db import transaction
+from django.db.models import BooleanField, Count, F, Prefetch, Value
+from django.http import Http404, StreamingHttpResponse
 from django_filters.rest_framework.backends import DjangoFilterBackend
 from djoser.views import UserViewSet as BaseUserViewSet
 from rest_framework import status, viewsets
@@ -10,21 +11,59 @@ from rest_framework.permissions import (IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
 
+from api.bulk import BulkFavorites, BulkShoppingCart, BulkSubscriptions
+from api.caching import RecipeRepresentationCache, VersionedCacheMixin
 from api.filters import IngredientFilter, RecipeFilter
-from api.paginators import PageLimitPagination
+from api.memberships import (FAVORITES, SHOPPING_CART, SUBSCRIPTIONS,
+                             get_memberships, lock_memberships)
+from api.metrics import SerializerMetricsMixin
+from api.paginators import FeedPagination, RecipePagination
 from api.permissions import Author
+from api.renderers import (ShoppingListCSVRenderer, ShoppingListPDFRenderer,
+                           ShoppingListTxtRenderer)
 from api.serializers import (FavoriteWriteSerializer, IngredientSerializer,
                              RecipeReadSerializer, RecipeUserSerializer,
                              RecipeWriteSerializer,
                              ShoppingCartWriteSerializer, SubscribeSerializer,
                              TagSerializer)
-from recipes import constants
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+from recipes import constants, versions
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (Favorite, FeedItem, Ingredient, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag)
 from users.models import Subscription, User
 
 
-class UserViewSet(BaseUserViewSet):
+class CachedRecipesMixin(SerializerMetricsMixin):
+    """Сериализация рецептов через RecipeRepresentationCache."""
+
+    def serialize_cached(self, recipes):
+        """
+        Сериализует рецепты, беря общие части из кэша.
+        Рецепты, которых нет в кэше, загружаются одним кверисетом
+        со всеми связями.
+        """
+        recipe_cache = RecipeRepresentationCache(self.request)
+        keys = recipe_cache.get_keys(recipes)
+        bodies = recipe_cache.get_many(keys)
+
+        missing = [recipe.pk for recipe in recipes if recipe.pk not in bodies]
+        if missing:
+            serializer = self.timed(RecipeReadSerializer)(
+                Recipe.objects.for_read().filter(pk__in=missing),
+                many=True, context=self.get_serializer_context()
+            )
+            fresh = {recipe['id']: recipe for recipe in serializer.data}
+            recipe_cache.set_many(keys, fresh)
+            bodies.update(fresh)
+
+        memberships = get_memberships(self.request)
+        return [
+            recipe_cache.overlay(bodies[recipe.pk], recipe, memberships)
+            for recipe in recipes
+        ]
+
+
+class UserViewSet(CachedRecipesMixin, BaseUserViewSet):
     pagination_class = LimitOffsetPagination
 
     def get_queryset(self):
@@ -44,12 +83,15 @@ class UserViewSet(BaseUserViewSet):
             User, pk=id
         )
 
-        serializer = SubscribeSerializer(
+        serializer = self.timed(SubscribeSerializer)(
             data={'author': author.id, 'user': request.user.id},
             context={'request': request}
         )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            lock_memberships(request.user.id)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        get_memberships(request).changed(SUBSCRIPTIONS)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @subscribe.mapping.delete
@@ -63,47 +105,142 @@ class UserViewSet(BaseUserViewSet):
             return Response("Нет такой подписки!",
                             status=status.HTTP_400_BAD_REQUEST)
 
-        subscription.delete()
+        with transaction.atomic():
+            lock_memberships(request.user.id)
+            subscription.delete()
+        get_memberships(request).changed(SUBSCRIPTIONS)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        methods=['post', 'delete'], detail=False, url_path='bulk/subscribe',
+        permission_classes=(IsAuthenticated,)
+    )
+    def bulk_subscribe(self, request):
+        """Подписка на несколько авторов или отписка от них."""
+        return BulkSubscriptions(request).handle()
+
     @action(
         methods=['get'], detail=False,
         permission_classes=[Author, IsAuthenticatedOrReadOnly]
     )
     def subscriptions(self, request):
+        recipes_limit = RecipeUserSerializer.parse_recipes_limit(request)
+        recipes = Recipe.objects.all()
+        if recipes_limit is not None:
+            recipes = recipes.filter(
+                author__subscribing__user_id=request.user.id
+            ).latest_per_author(recipes_limit)
         subscribers = User.objects.filter(
             subscribing__user_id=request.user.id
+        ).annotate(
+            recipes_count=Count('recipes'),
+            is_subscribed=Value(True, output_field=BooleanField()),
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='latest_recipes')
         )
+        context = {'request': request, 'recipes_limit': recipes_limit}
 
         page = self.paginate_queryset(subscribers)
         if page is not None:
-            serializer = RecipeUserSerializer(page, many=True,
-                                              context={'request': request})
+            serializer = self.timed(RecipeUserSerializer)(
+                page, many=True, context=context
+            )
             return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(subscribers, many=True)
+        serializer = self.timed(RecipeUserSerializer)(
+            subscribers, many=True, context=context
+        )
         return Response(serializer.data)
 
+    @action(
+        methods=['get'], detail=False,
+        permission_classes=(IsAuthenticated,)
+    )
+    def feed(self, request):
+        """
+        Новые рецепты авторов, на которых подписан пользователь.
+        Хронология из FeedItem дополняется рецептами популярных
+        авторов, которые не раскладываются по подписчикам.
+        """
+        sources = [(
+            FeedItem.objects.filter(user=request.user),
+            'pub_date', 'recipe_id', 'recipe__author_id'
+        )]
+        popular = (
+            get_memberships(request).subscriptions
+            & FeedItem.objects.popular_authors()
+        )
+        if popular:
+            sources.append((
+                Recipe.objects.filter(author_id__in=popular),
+                'pub_date', 'id', 'author_id'
+            ))
+        paginator = FeedPagination()
+        page = paginator.paginate_sources(sources, request)
+        return paginator.get_paginated_response(self.serialize_cached(page))
+
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(SerializerMetricsMixin, VersionedCacheMixin,
+                 viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    version_name = versions.TAGS
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(SerializerMetricsMixin, VersionedCacheMixin,
+                        viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
+    version_name = versions.INGREDIENTS
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        """
+        Поиск по `name` идёт по индексу в памяти, без запросов в базу.
+        """
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        serializer = self.get_serializer(
+            ingredient_index.search(name), many=True
+        )
+        return Response(serializer.data)
+
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(CachedRecipesMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = (Author, IsAuthenticatedOrReadOnly)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
-    pagination_class = PageLimitPagination
+    pagination_class = RecipePagination
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.serialize_cached(page))
+        return Response(self.serialize_cached(list(queryset)))
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(self.serialize_cached([self.get_object()])[0])
+
+    def update(self, request, *args, **kwargs):
+        """
+        В отличие от UpdateModelMixin не сбрасывает кэш prefetch:
+        RecipeWriteSerializer сам кладёт туда актуальные теги
+        и ингредиенты, и ответ строится без повторных запросов.
+        """
+        partial = kwargs.pop('partial', False)
+        instance = self.get_object()
+        serializer = self.get_serializer(
+            instance, data=request.data, partial=partial
+        )
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        return Response(serializer.data)
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -121,11 +258,14 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return Response("Нет такого рецепта",
                             status=status.HTTP_400_BAD_REQUEST)
         user = self.request.user
-        serializer = FavoriteWriteSerializer(
+        serializer = self.timed(FavoriteWriteSerializer)(
             data={'user': user.id, 'recipe': recipe.id}
         )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            lock_memberships(user.id)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        get_memberships(request).changed(FAVORITES)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @favorite.mapping.delete
@@ -136,7 +276,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
 
         if favorite:
-            favorite.delete()
+            with transaction.atomic():
+                lock_memberships(request.user.id)
+                favorite.delete()
+            get_memberships(request).changed(FAVORITES)
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
@@ -152,11 +295,14 @@ class RecipeViewSet(viewsets.ModelViewSet):
                             status=status.HTTP_400_BAD_REQUEST)
 
         user = self.request.user
-        serializer = ShoppingCartWriteSerializer(
+        serializer = self.timed(ShoppingCartWriteSerializer)(
             data={'user': user.id, 'recipe': recipe.id}
         )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            lock_memberships(user.id)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        get_memberships(request).changed(SHOPPING_CART)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @shopping_cart.mapping.delete
@@ -167,40 +313,59 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
 
         if shopping_cart:
-            shopping_cart.delete()
+            with transaction.atomic():
+                lock_memberships(request.user.id)
+                shopping_cart.delete()
+            get_memberships(request).changed(SHOPPING_CART)
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
     @action(
-        detail=False, methods=['get'],
+        methods=['post', 'delete'], detail=False, url_path='bulk/favorite',
         permission_classes=(IsAuthenticated,)
     )
-    def download_shopping_cart(self, request):
-        result = RecipeIngredient.objects.filter(
-            recipe__shopping_carts__user=self.request.user
+    def bulk_favorite(self, request):
+        """Добавление нескольких рецептов в избранное или удаление."""
+        return BulkFavorites(request).handle()
+
+    @action(
+        methods=['post', 'delete'], detail=False,
+        url_path='bulk/shopping_cart',
+        permission_classes=(IsAuthenticated,)
+    )
+    def bulk_shopping_cart(self, request):
+        """Добавление нескольких рецептов в корзину или удаление."""
+        return BulkShoppingCart(request).handle()
+
+    @action(
+        detail=False, methods=['get'],
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(ShoppingListTxtRenderer, ShoppingListCSVRenderer,
+                          ShoppingListPDFRenderer)
+    )
+    def download_shopping_cart(self, request, format=None):
+        """
+        Скачать список покупок.
+        Формат выбирается по заголовку Accept или параметру `format`:
+        txt (по умолчанию), csv или pdf.
+        """
+        result = ShoppingListItem.objects.filter(
+            user=self.request.user
         ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(
-            total_amount=Sum('amount')
+            'ingredient__name', 'ingredient__measurement_unit',
+            total_amount=F('amount')
         ).order_by(
             'ingredient__name'
-        )
+        ).iterator(chunk_size=constants.SHOPPING_LIST_CHUNK_SIZE)
 
-        data = self.parse_ingredients(result)
-        return self.download_file(content=data, filename=constants.FILE_NAME)
-
-    def parse_ingredients(self, result):
-        parsed_result = []
-        for ingredient in result:
-            name = ingredient['ingredient__name']
-            total_amount = ingredient['total_amount']
-            measurement_unit = ingredient['ingredient__measurement_unit']
-            parsed_result.append(
-                f"{name} - {total_amount} {measurement_unit} \n"
-            )
-        return parsed_result
+        renderer = request.accepted_renderer
+        return self.download_file(
+            content=renderer.stream(result),
+            filename=f'{constants.FILE_NAME}.{renderer.format}',
+            content_type=renderer.content_type,
+        )
 
-    def download_file(self, content, filename):
-        response = HttpResponse(content, content_type='text/plain')
+    def download_file(self, content, filename, content_type):
+        response = StreamingHttpResponse(content, content_type=content_type)
         response['Content-Disposition'] = f'attachment; filename="{filename}"'
         return response
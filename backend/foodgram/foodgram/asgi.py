@@ -9,8 +9,19 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
+from asgiref.sync import ThreadSensitiveContext
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+
+async def application(scope, receive, send):
+    """
+    Каждый запрос получает свой поток для синхронного кода.
+    Иначе Django 3.2 выполняет все синхронные представления
+    в одном общем потоке.
+    """
+    async with ThreadSensitiveContext():
+        return await django_application(scope, receive, send)
@@ -0,0 +1,56 @@
+import django
+from django.core.signals import request_started
+from django.db import connections
+
+HEALTH_CHECKS_BACKPORT = django.VERSION < (4, 1)
+
+
+class HealthChecksMixin:
+    """
+    Аналог CONN_HEALTH_CHECKS из Django 4.1 для бэкендов foodgram.db.
+
+    Постоянное соединение, пережившее прошлый запрос, проверяется
+    один раз при первом обращении к базе в новом запросе. Запросы,
+    которые не ходят в базу, проверку не делают.
+    """
+
+    health_check_done = True
+
+    def connect(self):
+        # Новое соединение проверять не нужно.
+        self.health_check_done = True
+        super().connect()
+
+    def set_autocommit(self, *args, **kwargs):
+        # transaction.atomic открывает соединение здесь, а не в _cursor.
+        self.check_health()
+        return super().set_autocommit(*args, **kwargs)
+
+    def _cursor(self, *args, **kwargs):
+        self.check_health()
+        return super()._cursor(*args, **kwargs)
+
+    def check_health(self):
+        if (
+            not HEALTH_CHECKS_BACKPORT
+            or self.connection is None
+            or self.health_check_done
+            or self.in_atomic_block
+            or not self.settings_dict.get('CONN_HEALTH_CHECKS')
+        ):
+            return
+        self.health_check_done = True
+        if not self.is_usable():
+            self.close()
+
+
+def reset_health_checks(**kwargs):
+    """Отмечает, что соединения нужно проверить перед использованием."""
+    for connection in connections.all():
+        if isinstance(connection, HealthChecksMixin):
+            connection.health_check_done = False
+
+
+def connect_health_checks():
+    if HEALTH_CHECKS_BACKPORT:
+        request_started.connect(reset_health_checks)
@@ -0,0 +1,67 @@
+import os
+import threading
+
+import psycopg2.extras
+from django.db.backends.postgresql import base
+from psycopg2 import pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL с пулом соединений внутри процесса.
+    Django закрывает соединение в конце запроса, а пул
+    возвращает его себе и выдаёт следующему запросу.
+    """
+
+    pools = {}
+    pools_lock = threading.Lock()
+
+    def get_pool(self, conn_params):
+        # Пул привязан к процессу: после fork нельзя делить сокеты.
+        key = (self.alias, os.getpid())
+        with self.pools_lock:
+            if key not in self.pools:
+                self.pools[key] = pool.ThreadedConnectionPool(
+                    self.settings_dict.get('POOL_MIN_SIZE', 1),
+                    self.settings_dict.get('POOL_SIZE', 10),
+                    **conn_params
+                )
+            return self.pools[key]
+
+    def get_new_connection(self, conn_params):
+        connection_pool = self.get_pool(conn_params)
+        connection = connection_pool.getconn()
+        if self.settings_dict.get('CONN_HEALTH_CHECKS'):
+            connection = self.check_pooled(connection_pool, connection)
+        self.connection_pool = connection_pool
+
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        psycopg2.extras.register_default_jsonb(
+            conn_or_curs=connection, loads=lambda x: x
+        )
+        return connection
+
+    def check_pooled(self, connection_pool, connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            connection.rollback()
+        except psycopg2.Error:
+            connection_pool.putconn(connection, close=True)
+            connection = connection_pool.getconn()
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.connection_pool.putconn(
+                    self.connection,
+                    close=self.connection.closed or self.errors_occurred
+                )
@@ -0,0 +1,7 @@
+from django.db.backends.postgresql import base
+
+from foodgram.db import HealthChecksMixin
+
+
+class DatabaseWrapper(HealthChecksMixin, base.DatabaseWrapper):
+    """PostgreSQL из Django с проверкой постоянных соединений."""
@@ -32,6 +32,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -73,15 +74,48 @@ WSGI_APPLICATION = 'foodgram.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': os.getenv('DB_ENGINE', default='django.db.backends.postgresql'),
+        # foodgram.db.postgresql - PostgreSQL из Django с CONN_HEALTH_CHECKS,
+        # пул foodgram.db.pool включается только явно.
+        'ENGINE': os.getenv('DB_ENGINE', default='foodgram.db.postgresql'),
         'NAME': os.getenv('DB_NAME', default='postgres'),
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('DB_HOST', default='db'),
-        'PORT': os.getenv('DB_PORT', default='5432')
+        'PORT': os.getenv('DB_PORT', default='5432'),
+        # Постоянные соединения: сколько секунд держать соединение открытым.
+        # С пулом (DB_ENGINE=foodgram.db.pool) и под ASGI нужно 0.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
+        'CONN_HEALTH_CHECKS': os.getenv(
+            'DB_CONN_HEALTH_CHECKS', default='True'
+        ) == 'True',
+        'POOL_SIZE': int(os.getenv('DB_POOL_SIZE', default=10)),
     }
 }
 
+# Версии, ETag, кэши ответов, множеств пользователя и токенов должны быть
+# общими для всех воркеров gunicorn и management-команд. Если задан
+# CACHE_LOCATION (например, memcached:11211), по умолчанию используется
+# memcached; без него — LocMemCache, отдельный в каждом процессе.
+CACHE_LOCATION = os.getenv('CACHE_LOCATION', default='')
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default=(
+                'django.core.cache.backends.memcached.PyMemcacheCache'
+                if CACHE_LOCATION
+                else 'django.core.cache.backends.locmem.LocMemCache'
+            )
+        ),
+        'LOCATION': CACHE_LOCATION,
+    }
+}
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+SHARED_CACHE = CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -134,8 +168,12 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
 
+    # Удаление токена при выходе должно дойти до всех воркеров,
+    # поэтому токены кэшируются только в общем кэше.
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication'
+        if SHARED_CACHE
+        else 'rest_framework.authentication.TokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
@@ -149,3 +187,15 @@ DJOSER = {
         'user_create': 'api.serializers.UserCreateSerializer',
     },
 }
+
+# /api/metrics/ доступен администраторам и по заголовку
+# `Authorization: Bearer <токен>`, если токен задан.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Асинхронные версии тяжёлых по вводу-выводу эндпоинтов для запуска под ASGI.
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False') == 'True'
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
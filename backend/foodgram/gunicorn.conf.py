@@ -0,0 +1,46 @@
+"""
+Настройки gunicorn, задаются переменными окружения.
+
+Запуск: gunicorn foodgram.wsgi:application -c gunicorn.conf.py
+Для ASGI: GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker
+и приложение foodgram.asgi:application.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0:8000')
+# Без общего кэша (CACHE_LOCATION, см. settings.CACHES) у каждого
+# воркера свой LocMemCache и изменения не видны остальным,
+# поэтому по умолчанию запускается один воркер.
+shared_cache = bool(os.getenv('CACHE_LOCATION'))
+workers = int(os.getenv(
+    'GUNICORN_WORKERS',
+    multiprocessing.cpu_count() * 2 + 1 if shared_cache else 1
+))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True') == 'True'
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+accesslog = os.getenv('GUNICORN_ACCESSLOG', '-')
+
+
+def on_starting(server):
+    if server.cfg.workers > 1 and not shared_cache:
+        server.log.warning(
+            'Несколько воркеров без общего кэша: задайте CACHE_LOCATION, '
+            'иначе кэши воркеров будут расходиться.'
+        )
+
+
+def post_fork(server, worker):
+    """
+    Соединения с базой, открытые в мастере при preload,
+    не должны достаться воркерам.
+    """
+    from django.db import connections
+
+    connections.close_all()
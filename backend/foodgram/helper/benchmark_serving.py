@@ -0,0 +1,159 @@
+"""
+Сравнение пропускной способности WSGI и ASGI при растущей конкурентности.
+
+Оба сервера запускаются заранее на одной базе, например:
+    gunicorn foodgram.wsgi:application --bind 0:8000
+    ASYNC_VIEWS=True gunicorn foodgram.asgi:application \
+        -k uvicorn.workers.UvicornWorker --bind 0:8001
+
+Запуск:
+    python helper/benchmark_serving.py \
+        --server wsgi=http://127.0.0.1:8000 \
+        --server asgi=http://127.0.0.1:8001 \
+        --token <token> --concurrency 1 8 32 128 --slow-clients 4
+
+Медленные клиенты передают тело запроса по байту, имитируя загрузку
+картинки по плохой сети: синхронный воркер занят ими целиком.
+"""
+import argparse
+import http.client
+import socket
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlsplit
+
+SLOW_BODY_SIZE = 64
+SLOW_BYTE_DELAY = 0.1
+DEFAULT_PATHS = (
+    '/api/tags/',
+    '/api/ingredients/?name=са',
+    '/api/recipes/download_shopping_cart/',
+)
+
+
+class Worker(threading.local):
+    """Одно keep-alive соединение на поток."""
+
+    connection = None
+
+
+def request(worker, base, path, headers):
+    url = urlsplit(base)
+    if worker.connection is None:
+        worker.connection = http.client.HTTPConnection(
+            url.hostname, url.port or 80, timeout=60
+        )
+    started = time.perf_counter()
+    try:
+        worker.connection.request(
+            'GET', quote(path, safe='/?=&%'), headers=headers
+        )
+        response = worker.connection.getresponse()
+        response.read()
+        status = response.status
+    except (OSError, http.client.HTTPException):
+        worker.connection.close()
+        worker.connection = None
+        status = None
+    return status, time.perf_counter() - started
+
+
+def slow_client(base, headers, stop):
+    url = urlsplit(base)
+    head = ''.join(f'{name}: {value}\r\n' for name, value in headers.items())
+    while not stop.is_set():
+        try:
+            with socket.create_connection(
+                (url.hostname, url.port or 80), timeout=60
+            ) as sock:
+                sock.sendall((
+                    'POST /api/recipes/ HTTP/1.1\r\n'
+                    f'Host: {url.hostname}\r\n{head}'
+                    'Content-Type: application/json\r\n'
+                    f'Content-Length: {SLOW_BODY_SIZE}\r\n\r\n'
+                ).encode())
+                for _ in range(SLOW_BODY_SIZE):
+                    if stop.wait(SLOW_BYTE_DELAY):
+                        return
+                    sock.sendall(b' ')
+                sock.recv(65536)
+        except OSError:
+            stop.wait(SLOW_BYTE_DELAY)
+
+
+def run_level(base, paths, headers, concurrency, total):
+    worker = Worker()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(
+            lambda number: request(
+                worker, base, paths[number % len(paths)], headers
+            ),
+            range(total)
+        ))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency for _, latency in results)
+    errors = sum(1 for status, _ in results if status != 200)
+    return {
+        'rps': total / elapsed,
+        'p50': statistics.median(latencies) * 1000,
+        'p95': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        '--server', action='append', required=True,
+        help='Имя и адрес сервера: wsgi=http://127.0.0.1:8000'
+    )
+    parser.add_argument('--path', action='append', help='Путь запроса')
+    parser.add_argument('--token', help='Токен для авторизованных запросов')
+    parser.add_argument(
+        '--concurrency', type=int, nargs='+', default=[1, 8, 32, 128]
+    )
+    parser.add_argument(
+        '--slow-clients', type=int, default=0,
+        help='Число медленных клиентов во время замеров'
+    )
+    parser.add_argument(
+        '--requests', type=int, default=500,
+        help='Число запросов на каждый уровень конкурентности'
+    )
+    args = parser.parse_args()
+    headers = {'Accept': '*/*'}
+    if args.token:
+        headers['Authorization'] = f'Token {args.token}'
+    paths = args.path or DEFAULT_PATHS
+
+    print(f'{"сервер":<8}{"потоки":>8}{"rps":>10}{"p50, мс":>10}'
+          f'{"p95, мс":>10}{"ошибки":>8}')
+    for server in args.server:
+        name, _, base = server.partition('=')
+        stop = threading.Event()
+        slow = [
+            threading.Thread(target=slow_client, args=(base, headers, stop))
+            for _ in range(args.slow_clients)
+        ]
+        for thread in slow:
+            thread.start()
+        try:
+            for concurrency in args.concurrency:
+                result = run_level(
+                    base, paths, headers, concurrency,
+                    max(args.requests, concurrency)
+                )
+                print(f'{name:<8}{concurrency:>8}{result["rps"]:>10.1f}'
+                      f'{result["p50"]:>10.1f}{result["p95"]:>10.1f}'
+                      f'{result["errors"]:>8}')
+        finally:
+            stop.set()
+            for thread in slow:
+                thread.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,14 @@
 from django.contrib import admin
 
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+                            RecipeTag, ShoppingCart, Tag)
 
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ['pk', 'name', 'measurement_unit']
     search_fields = ['name']
-    list_filter = ['name']
+    list_filter = ['measurement_unit']
     empty_value_display = '-----'
 
 
@@ -23,37 +23,66 @@ class TagAdmin(admin.ModelAdmin):
 class RecipeIngredientInline(admin.TabularInline):
     model = RecipeIngredient
     min_num = 1
+    extra = 0
+    autocomplete_fields = ['ingredient']
+
+
+class RecipeTagInline(admin.TabularInline):
+    model = RecipeTag
+    min_num = 1
+    extra = 0
+    autocomplete_fields = ['tag']
 
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ['pk', 'name', 'author', 'favorites']
+    list_display = ['pk', 'name', 'author', 'favorites', 'shopping_carts']
+    list_select_related = ['author']
     search_fields = ['name', 'author__username']
-    list_filter = ['name', 'author', 'tags']
+    list_filter = ['tags']
+    autocomplete_fields = ['author']
+    show_full_result_count = False
     empty_value_display = '-----'
     inlines = [
+        RecipeTagInline,
         RecipeIngredientInline,
     ]
 
+    @admin.display(description='В избранном', ordering='favorites_count')
     def favorites(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
+
+    @admin.display(
+        description='В списках покупок', ordering='shopping_cart_count'
+    )
+    def shopping_carts(self, obj):
+        return obj.shopping_cart_count
 
 
 @admin.register(RecipeIngredient)
 class RecipeIngredientAdmin(admin.ModelAdmin):
     list_display = ['pk', 'recipe', 'ingredient', 'amount']
+    list_select_related = ['recipe', 'ingredient']
+    autocomplete_fields = ['recipe', 'ingredient']
+    show_full_result_count = False
     empty_value_display = '-----'
 
 
 @admin.register(ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'recipe']
+    list_select_related = ['user', 'recipe']
     search_fields = ['user__username', 'user__email']
+    autocomplete_fields = ['user', 'recipe']
+    show_full_result_count = False
     empty_value_display = '-----'
 
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'recipe']
+    list_select_related = ['user', 'recipe']
     search_fields = ['user__username', 'user__email']
+    autocomplete_fields = ['user', 'recipe']
+    show_full_result_count = False
     empty_value_display = '-----'
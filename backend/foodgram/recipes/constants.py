@@ -9,3 +9,26 @@ COOKING_TIME = 1
 FILE_NAME = 'list_of_ingredients'
 MAX_INGREDIENT_AMOUNT = 9999
 MIN_INGREDIENT_AMOUNT = 1
+SHOPPING_LIST_CHUNK_SIZE = 2000
+SHOPPING_LIST_BUFFER_SIZE = 8192
+PDF_FONT_NAME = 'ShoppingListFont'
+PDF_FONT_SIZE = 12
+PDF_LINE_HEIGHT = 18
+PDF_MARGIN = 50
+INGREDIENT_SEARCH_LIMIT = 20
+REFERENCE_DATA_CACHE_TIMEOUT = 60 * 60 * 24
+RECIPE_CACHE_TIMEOUT = 60 * 60
+MEMBERSHIP_CACHE_TIMEOUT = 60 * 60
+IMAGE_MAX_BYTES = 5 * 1024 * 1024
+IMAGE_MAX_PIXELS = 4096 * 4096
+IMAGE_SPOOL_SIZE = 1024 * 1024
+IMAGE_BASE64_CHUNK_SIZE = 64 * 1024
+FEED_MAX_ITEMS = 500
+FEED_TRIM_EVERY = 20
+FEED_FANOUT_BATCH_SIZE = 1000
+FEED_POPULAR_FOLLOWERS = 10000
+FEED_POPULAR_CACHE_TIMEOUT = 10 * 60
+TOKEN_CACHE_TIMEOUT = 5 * 60
+BULK_MAX_ITEMS = 100
+LOCAL_VERSION_TIMEOUT = 60
+DOWNLOAD_SPOOL_SIZE = 1024 * 1024
@@ -0,0 +1,85 @@
+import threading
+from bisect import bisect_left, bisect_right
+
+from recipes import constants, versions
+from recipes.models import Ingredient
+
+MAX_CHAR = chr(0x10FFFF)
+SEPARATOR = '\n'
+
+
+class IngredientIndex:
+    """
+    Индекс названий ингредиентов в памяти процесса.
+
+    Названия хранятся в отсортированном списке в нижнем регистре
+    (casefold), поиск по префиксу идёт через bisect. Для поиска по
+    подстроке названия склеены в одну строку, по которой ищет str.find.
+    Индекс строится при первом обращении и перестраивается, когда
+    меняется версия ингредиентов (см. recipes.versions).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+
+    def _load(self):
+        version = versions.get_version(versions.INGREDIENTS)
+        state = self._state
+        if state is not None and state[0] == version:
+            return state[1:]
+        with self._lock:
+            if self._state is None or self._state[0] != version:
+                ingredients = sorted(
+                    (name.casefold(), name, unit, pk)
+                    for pk, name, unit in Ingredient.objects.values_list(
+                        'id', 'name', 'measurement_unit'
+                    ).iterator()
+                )
+                keys = [key for key, *_ in ingredients]
+                rows = [
+                    Ingredient(id=pk, name=name, measurement_unit=unit)
+                    for _, name, unit, pk in ingredients
+                ]
+                offsets = []
+                offset = 0
+                for key in keys:
+                    offsets.append(offset)
+                    offset += len(key) + len(SEPARATOR)
+                self._state = (
+                    version, keys, rows, SEPARATOR.join(keys), offsets
+                )
+            return self._state[1:]
+
+    def search(self, query, limit=constants.INGREDIENT_SEARCH_LIMIT):
+        """
+        Возвращает не более `limit` ингредиентов: сначала точные
+        совпадения, затем совпадения по началу названия, затем
+        по подстроке.
+        """
+        keys, rows, haystack, offsets = self._load()
+        query = query.strip().casefold()
+        if not query:
+            return []
+
+        start = bisect_left(keys, query)
+        exact_end = start
+        while exact_end < len(keys) and keys[exact_end] == query:
+            exact_end += 1
+        prefix_end = bisect_left(keys, query + MAX_CHAR, lo=exact_end)
+
+        result = rows[start:min(prefix_end, start + limit)]
+        if SEPARATOR in query:
+            return result
+        found = haystack.find(query)
+        while found != -1 and len(result) < limit:
+            position = bisect_right(offsets, found) - 1
+            if not start <= position < prefix_end:
+                result.append(rows[position])
+            found = haystack.find(
+                query, offsets[position] + len(keys[position])
+            )
+        return result
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,399 @@
+import json
+import random
+import re
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.metrics import RequestMetrics
+from recipes.models import (Favorite, FeedItem, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Tag)
+from users.models import Subscription, User
+
+HTTP_FILE = Path(settings.BASE_DIR) / 'helper' / 'requests.http'
+POSTMAN_FILE = (
+    Path(settings.BASE_DIR).parent.parent
+    / 'postman-collection' / 'diploma.postman_collection.json'
+)
+BENCH_PREFIX = 'bench'
+PERCENTILES = (50, 95, 99)
+ID_SEGMENT = re.compile(r'^(\d+|\{\{\w+\}\})$')
+VARIABLE = re.compile(r'\{\{(\w+)\}\}')
+AUTHOR_ID = re.compile(r'author=\d+')
+
+
+def percentile(values, rank):
+    """Перцентиль по ближайшему рангу для отсортированного списка."""
+    index = max(0, -(-len(values) * rank // 100) - 1)
+    return values[index]
+
+
+def read_http_file(path):
+    for block in path.read_text(encoding='utf-8').split('###'):
+        for line in block.splitlines()[1:]:
+            parts = line.split()
+            if len(parts) == 2 and parts[0].isupper():
+                yield parts[0], parts[1]
+                break
+
+
+def read_postman(path):
+    def walk(items):
+        for item in items:
+            if 'item' in item:
+                yield from walk(item['item'])
+                continue
+            request = item['request']
+            url = request['url']
+            yield request['method'], (
+                url['raw'] if isinstance(url, dict) else url
+            )
+
+    yield from walk(json.loads(path.read_text(encoding='utf-8'))['item'])
+
+
+def get_template(url):
+    """
+    Шаблон эндпоинта: адрес сервера отбрасывается, id в пути
+    и переменные Postman заменяются на `{id}`, id автора в фильтре -
+    на переменную `{{userId}}`.
+    """
+    parts = urlsplit(url.replace('{{baseUrl}}', 'http://localhost'))
+    path = '/'.join(
+        '{id}' if ID_SEGMENT.match(segment) else segment
+        for segment in parts.path.split('/')
+    )
+    query = AUTHOR_ID.sub('author={{userId}}', parts.query)
+    return f'{path}?{query}' if query else path
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный прогон API по запросам из helper/requests.http '
+        'и коллекции Postman: перцентили времени ответа, пропускная '
+        'способность и число SQL-запросов по эндпоинтам.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Создать столько тестовых рецептов перед прогоном'
+        )
+        parser.add_argument(
+            '--allow-write', action='store_true',
+            help='Разрешить --seed записывать тестовые данные в базу'
+        )
+        parser.add_argument(
+            '--source', choices=('http', 'postman', 'all'), default='all',
+            help='Откуда брать запросы'
+        )
+        parser.add_argument(
+            '--methods', default='GET',
+            help='HTTP-методы через запятую, по умолчанию только GET'
+        )
+        parser.add_argument(
+            '--only', default=None,
+            help='Регулярное выражение для отбора эндпоинтов'
+        )
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument(
+            '--requests', type=int, default=1000,
+            help='Всего запросов в замере, без учёта прогрева'
+        )
+        parser.add_argument(
+            '--output', default=None, help='Сохранить результаты в JSON'
+        )
+        parser.add_argument(
+            '--compare', default=None,
+            help='Сравнить с результатами из JSON-файла'
+        )
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            if not options['allow_write']:
+                raise CommandError(
+                    '--seed записывает тестовых пользователей и рецепты '
+                    f'в базу {connection.settings_dict["NAME"]}. Укажите '
+                    'отдельную базу в DB_NAME и добавьте --allow-write.'
+                )
+            self.seed(options['seed'])
+        user = User.objects.filter(
+            username__startswith=BENCH_PREFIX
+        ).order_by('pk').first()
+        if user is None or not Recipe.objects.exists():
+            raise CommandError(
+                'Нет тестовых данных, запустите с параметром --seed.'
+            )
+        self.token = Token.objects.get_or_create(user=user)[0].key
+        self.random = random.Random(0)
+
+        endpoints = self.collect(options)
+        if not endpoints:
+            raise CommandError('Не найдено ни одного запроса.')
+        plan = [
+            endpoints[number % len(endpoints)]
+            for number in range(options['requests'])
+        ]
+        with override_settings(DEBUG=False, ALLOWED_HOSTS=['testserver']):
+            self.run(endpoints, options['concurrency'])
+            started = time.perf_counter()
+            samples = self.run(plan, options['concurrency'])
+            elapsed = time.perf_counter() - started
+
+        results = self.summarize(samples, elapsed, options)
+        self.print_results(results)
+        if options['compare']:
+            self.compare(results, options['compare'])
+        if options['output']:
+            Path(options['output']).write_text(
+                json.dumps(results, ensure_ascii=False, indent=2),
+                encoding='utf-8'
+            )
+
+    def collect(self, options):
+        methods = {
+            method.strip().upper()
+            for method in options['methods'].split(',')
+        }
+        sources = []
+        if options['source'] in ('http', 'all'):
+            sources.append(read_http_file(HTTP_FILE))
+        if options['source'] in ('postman', 'all') and POSTMAN_FILE.exists():
+            sources.append(read_postman(POSTMAN_FILE))
+        only = re.compile(options['only']) if options['only'] else None
+        endpoints = {}
+        for source in sources:
+            for method, url in source:
+                template = get_template(url)
+                if method not in methods or '/auth/' in template:
+                    continue
+                if only and not only.search(f'{method} {template}'):
+                    continue
+                endpoints.setdefault(
+                    f'{method} {template}', (method, template)
+                )
+        return [
+            (name, method, template)
+            for name, (method, template) in sorted(endpoints.items())
+        ]
+
+    def resolve(self, template):
+        """Подставляет в шаблон id и значения из тестовых данных."""
+        ids = self.ids
+        segments = template.split('?')[0].split('/')
+        for index, segment in enumerate(segments):
+            if segment == '{id}':
+                segments[index] = str(self.random.choice(
+                    ids.get(segments[index - 1], ids['recipes'])
+                ))
+        path = '/'.join(segments)
+        query = template.partition('?')[2]
+        query = VARIABLE.sub(
+            lambda match: self.variable(match.group(1)), query
+        )
+        return f'{path}?{query}' if query else path
+
+    def variable(self, name):
+        if name.endswith('TagSlug'):
+            return self.random.choice(self.ids['slugs'])
+        if name.startswith('ingredientName'):
+            return 'а'
+        return str(self.random.choice(self.ids['users']))
+
+    def run(self, plan, concurrency):
+        self.ids = {
+            'users': list(User.objects.filter(
+                username__startswith=BENCH_PREFIX
+            ).values_list('pk', flat=True)),
+            'recipes': list(Recipe.objects.values_list('pk', flat=True)),
+            'tags': list(Tag.objects.values_list('pk', flat=True)),
+            'slugs': list(Tag.objects.values_list('slug', flat=True)),
+            'ingredients': list(
+                Ingredient.objects.values_list('pk', flat=True)[:500]
+            ),
+        }
+        local = threading.local()
+        thread_connections = []
+        urls = [
+            (name, method, self.resolve(template))
+            for name, method, template in plan
+        ]
+
+        def send(item):
+            name, method, url = item
+            if not hasattr(local, 'client'):
+                local.client = APIClient()
+                local.client.credentials(
+                    HTTP_AUTHORIZATION=f'Token {self.token}'
+                )
+                thread_connections.append(connections[DEFAULT_DB_ALIAS])
+            metrics = RequestMetrics()
+            started = time.perf_counter()
+            with connection.execute_wrapper(metrics):
+                response = local.client.generic(method, url)
+                # Потоковый ответ формируется и делает запросы к базе
+                # только при чтении тела.
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+            return (
+                name, time.perf_counter() - started,
+                response.status_code, metrics.queries
+            )
+
+        with ThreadPoolExecutor(concurrency) as pool:
+            samples = list(pool.map(send, urls))
+        for thread_connection in thread_connections:
+            thread_connection.inc_thread_sharing()
+            thread_connection.close()
+            thread_connection.dec_thread_sharing()
+        return samples
+
+    def summarize(self, samples, elapsed, options):
+        grouped = defaultdict(list)
+        for sample in samples:
+            grouped[sample[0]].append(sample)
+        grouped['total'] = samples
+        endpoints = {}
+        for name, items in grouped.items():
+            latencies = sorted(latency for _, latency, _, _ in items)
+            stats = {
+                'requests': len(items),
+                'errors': sum(1 for _, _, code, _ in items if code >= 400),
+                'rps': round(len(items) / elapsed, 1),
+                'queries': round(
+                    sum(queries for *_, queries in items) / len(items), 2
+                ),
+            }
+            for rank in PERCENTILES:
+                stats[f'p{rank}_ms'] = round(
+                    percentile(latencies, rank) * 1000, 2
+                )
+            endpoints[name] = stats
+        return {
+            'commit': self.get_commit(),
+            'date': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'concurrency': options['concurrency'],
+            'elapsed': round(elapsed, 3),
+            'endpoints': endpoints,
+        }
+
+    def get_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                capture_output=True, text=True, check=True,
+                cwd=settings.BASE_DIR
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def print_results(self, results):
+        self.stdout.write(
+            f'{"эндпоинт":<60}{"n":>6}{"p50":>9}{"p95":>9}{"p99":>9}'
+            f'{"rps":>8}{"SQL":>7}{"ошибки":>8}'
+        )
+        for name, stats in results['endpoints'].items():
+            self.stdout.write(
+                f'{name[:59]:<60}{stats["requests"]:>6}'
+                f'{stats["p50_ms"]:>9.1f}{stats["p95_ms"]:>9.1f}'
+                f'{stats["p99_ms"]:>9.1f}{stats["rps"]:>8.1f}'
+                f'{stats["queries"]:>7.1f}{stats["errors"]:>8}'
+            )
+
+    def compare(self, results, path):
+        previous = json.loads(Path(path).read_text(encoding='utf-8'))
+        self.stdout.write(
+            f'\nСравнение с {previous.get("commit") or path}:'
+        )
+        for name, stats in results['endpoints'].items():
+            old = previous['endpoints'].get(name)
+            if old is None:
+                continue
+            changes = ', '.join(
+                f'{key} {old[key]} -> {stats[key]}'
+                for key in ('p50_ms', 'p95_ms', 'queries')
+                if old[key] != stats[key]
+            )
+            self.stdout.write(f'{name[:59]:<60}{changes}')
+
+    def seed(self, count):
+        """Тестовые пользователи, теги и рецепты с префиксом bench."""
+        self.stdout.write(f'Создание {count} тестовых рецептов...')
+        if not Ingredient.objects.exists():
+            call_command('import_csv_command', verbosity=0)
+        rng = random.Random(0)
+        users = User.objects.filter(username__startswith=BENCH_PREFIX)
+        if not users.exists():
+            User.objects.bulk_create(
+                User(
+                    username=f'{BENCH_PREFIX}{number}',
+                    email=f'{BENCH_PREFIX}{number}@example.com',
+                    first_name='Bench', last_name=str(number),
+                )
+                for number in range(20)
+            )
+        users = list(users)
+        tags = list(Tag.objects.filter(slug__startswith=BENCH_PREFIX))
+        if not tags:
+            tags = [
+                Tag.objects.create(
+                    name=f'{BENCH_PREFIX}{number}',
+                    color=f'#BE{number:04d}', slug=f'{BENCH_PREFIX}{number}'
+                )
+                for number in range(3)
+            ]
+        ingredients = list(
+            Ingredient.objects.values_list('pk', flat=True)[:500]
+        )
+        for number in range(count):
+            recipe = Recipe.objects.create(
+                author=rng.choice(users), name=f'Bench {number}',
+                text='Тестовый рецепт.', image='recipes/images/bench.png',
+                cooking_time=rng.randint(1, 120),
+            )
+            recipe.tags.set(rng.sample(tags, 2))
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient_id=ingredient,
+                    amount=rng.randint(1, 500)
+                )
+                for ingredient in rng.sample(ingredients, 6)
+            )
+        me = users[0]
+        recipes = list(Recipe.objects.values_list('pk', flat=True))
+        favorites = rng.sample(recipes, min(30, len(recipes)))
+        Favorite.objects.bulk_create(
+            (Favorite(user=me, recipe_id=pk) for pk in favorites),
+            ignore_conflicts=True
+        )
+        in_cart = set(ShoppingCart.objects.filter(
+            user=me
+        ).values_list('recipe_id', flat=True))
+        cart = set(rng.sample(recipes, min(10, len(recipes)))) - in_cart
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=me, recipe_id=pk) for pk in cart
+        )
+        for pk in cart:
+            ShoppingListItem.objects.add_recipe([me.pk], Recipe(pk=pk))
+        Recipe.objects.filter(pk__in={*favorites, *cart}).recount()
+        Subscription.objects.bulk_create(
+            (Subscription(user=me, author=author) for author in users[1:8]),
+            ignore_conflicts=True
+        )
+        FeedItem.objects.rebuild([me.pk])
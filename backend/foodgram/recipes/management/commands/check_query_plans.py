@@ -0,0 +1,146 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeTag,
+                            ShoppingCart, ShoppingListItem, Tag)
+from recipes.search import missing_search_objects, search_recipes
+from users.models import Subscription, User
+
+PAGE_SIZE = 6
+
+SEQ_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'SCAN (?:TABLE )?(\w+)(?! USING)(?!\w)'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверка планов горячих запросов через EXPLAIN. Завершается '
+        'ошибкой, если какой-то запрос читает таблицу целиком или '
+        'в базе нет триггеров поиска.'
+    )
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        pattern = SEQ_SCAN_PATTERNS.get(vendor)
+        if pattern is None:
+            raise CommandError(f'База {vendor} не поддерживается.')
+
+        # Подзапросы в FROM (ranked у latest_per_author) тоже читаются
+        # целиком, но это уже отобранные по индексу строки.
+        tables = set(connection.introspection.table_names())
+        failed = []
+        missing = missing_search_objects(connection)
+        if missing:
+            failed.append('recipes.search_triggers')
+            self.stderr.write(
+                f'recipes.search_triggers: нет {", ".join(missing)}. '
+                'Миграция пересоздала таблицу recipes_recipe, добавьте '
+                'в неё триггеры из 0006_recipe_search.'
+            )
+        else:
+            self.stdout.write('recipes.search_triggers: OK')
+        for name, queryset in self.get_queries(vendor):
+            plan = self.explain(queryset, vendor)
+            scans = [
+                table for table in pattern.findall(plan) if table in tables
+            ]
+            if scans:
+                failed.append(name)
+                self.stderr.write(
+                    f'{name}: полное чтение {", ".join(sorted(set(scans)))}'
+                )
+                self.stderr.write(plan)
+            else:
+                self.stdout.write(f'{name}: OK')
+                if options['verbosity'] > 1:
+                    self.stdout.write(plan)
+
+        if failed:
+            raise CommandError(
+                f'Не пройдены проверки: {", ".join(failed)}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Все горячие запросы используют индексы.'
+        ))
+
+    def explain(self, queryset, vendor):
+        if vendor != 'postgresql':
+            return queryset.explain()
+        # На маленьких таблицах PostgreSQL предпочитает Seq Scan даже при
+        # наличии индекса, поэтому проверяем, что индекс вообще применим.
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            return queryset.explain()
+
+    def get_queries(self, vendor):
+        """Запросы той же формы, что выполняют api/views.py и filters.py."""
+        user = User.objects.order_by('pk').first()
+        user_id = user.pk if user else 0
+        recipe = Recipe.objects.order_by('pk').first()
+        recipe_id = recipe.pk if recipe else 0
+        pub_date = recipe.pub_date if recipe else timezone.now()
+        tag = Tag.objects.order_by('pk').first()
+        tag_slug = tag.slug if tag else ''
+
+        queries = [
+            ('recipes.feed',
+             Recipe.objects.order_by('-pub_date', '-id')[:PAGE_SIZE]),
+            ('recipes.feed_keyset',
+             Recipe.objects.filter(
+                 Q(pub_date__lt=pub_date)
+                 | Q(pub_date=pub_date, id__lt=recipe_id)
+             ).order_by('-pub_date', '-id')[:PAGE_SIZE]),
+            ('recipes.most_favorited',
+             Recipe.objects.order_by(
+                 '-favorites_count', '-id'
+             )[:PAGE_SIZE]),
+            ('recipes.most_in_shopping_carts',
+             Recipe.objects.order_by(
+                 '-shopping_cart_count', '-id'
+             )[:PAGE_SIZE]),
+            ('recipes.by_author',
+             Recipe.objects.filter(author_id=user_id)[:PAGE_SIZE]),
+            ('recipes.latest_per_author',
+             Recipe.objects.filter(
+                 author_id__in=[user_id]
+             ).latest_per_author(PAGE_SIZE)),
+            ('recipe_tags.by_tag',
+             RecipeTag.objects.filter(
+                 tag__slug=tag_slug
+             ).values('recipe_id')),
+            ('favorites.by_recipe',
+             Favorite.objects.filter(recipe_id=recipe_id)),
+            ('favorites.by_user',
+             Favorite.objects.filter(
+                 user_id=user_id
+             ).order_by().values_list('recipe_id', flat=True)),
+            ('shopping_carts.by_recipe',
+             ShoppingCart.objects.filter(recipe_id=recipe_id)),
+            ('shopping_carts.by_user',
+             ShoppingCart.objects.filter(
+                 user_id=user_id
+             ).order_by().values_list('recipe_id', flat=True)),
+            ('subscriptions.by_user',
+             Subscription.objects.filter(
+                 user_id=user_id
+             ).order_by().values_list('author_id', flat=True)),
+            ('shopping_list.by_user',
+             ShoppingListItem.objects.filter(user_id=user_id)),
+        ]
+        if vendor == 'postgresql':
+            # В SQLite поиск идёт по виртуальной таблице FTS5, её план
+            # всегда выглядит как SCAN.
+            queries += [
+                ('ingredients.name_prefix',
+                 Ingredient.objects.filter(name__istartswith='мол')),
+                ('recipes.search',
+                 search_recipes(Recipe.objects.all(), 'суп')[:PAGE_SIZE]),
+            ]
+        return queries
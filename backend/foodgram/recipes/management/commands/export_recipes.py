@@ -0,0 +1,106 @@
+import base64
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Выгрузка рецептов в формате JSON Lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', type=str, default='-',
+            help='Путь к файлу, по умолчанию стандартный вывод'
+        )
+        parser.add_argument(
+            '--images', choices=('path', 'base64'), default='path',
+            help='Выгружать путь к картинке или саму картинку в base64'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Сколько рецептов читать из базы за раз'
+        )
+
+    def handle(self, *args, **options):
+        if options['output'] == '-':
+            self.export(sys.stdout, options)
+        else:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                self.export(output, options)
+
+    def export(self, output, options):
+        started = time.monotonic()
+        exported = 0
+        for recipes in self.batches(options['batch_size']):
+            for recipe in recipes:
+                output.write(json.dumps(
+                    self.serialize(recipe, options['images']),
+                    ensure_ascii=False
+                ))
+                output.write('\n')
+            exported += len(recipes)
+            self.report(exported, started)
+        self.stderr.write(self.style.SUCCESS(
+            f'Выгружено рецептов: {exported}.'
+        ))
+
+    def batches(self, batch_size):
+        """
+        Рецепты пачками по id: prefetch не работает с .iterator(),
+        поэтому связи подгружаются для каждой пачки отдельно.
+        """
+        last_pk = 0
+        while True:
+            pks = list(Recipe.objects.filter(pk__gt=last_pk).order_by(
+                'pk'
+            ).values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                return
+            yield list(Recipe.objects.for_read().filter(
+                pk__in=pks
+            ).order_by('pk'))
+            last_pk = pks[-1]
+
+    def serialize(self, recipe, images):
+        data = {
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'pub_date': recipe.pub_date.isoformat(),
+            'author': recipe.author.email,
+            'tags': [
+                {'name': tag.name, 'color': tag.color, 'slug': tag.slug}
+                for tag in recipe.tags.all()
+            ],
+            'ingredients': [
+                {
+                    'name': item.ingredient.name,
+                    'measurement_unit': item.ingredient.measurement_unit,
+                    'amount': item.amount,
+                }
+                for item in recipe.recipes_ingredients.all()
+            ],
+        }
+        if images == 'base64' and recipe.image:
+            try:
+                with recipe.image.open('rb') as image:
+                    data['image_base64'] = base64.b64encode(
+                        image.read()
+                    ).decode('ascii')
+                return data
+            except FileNotFoundError:
+                self.stderr.write(f'Нет файла картинки {recipe.image.name}')
+        data['image'] = recipe.image.name
+        return data
+
+    def report(self, count, started):
+        elapsed = time.monotonic() - started
+        self.stderr.write(
+            f'{count} рецептов, {count / elapsed if elapsed else 0:.0f} в с'
+        )
@@ -0,0 +1,349 @@
+import csv
+import io
+import random
+import time
+from bisect import bisect
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from recipes import versions
+from recipes.models import (Favorite, FeedItem, Ingredient, Recipe,
+                            RecipeIngredient, RecipeTag, ShoppingCart,
+                            ShoppingListItem, Tag)
+from users.models import Subscription, User
+
+BATCH_SIZE = 10000
+FEED_BATCH_SIZE = 500
+PASSWORD = 'GeneratedPass!123'
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+    ('Десерт', '#F2A93B', 'dessert'),
+    ('Выпечка', '#C97B4A', 'bakery'),
+    ('Суп', '#3B8EDE', 'soup'),
+    ('Салат', '#6DBE45', 'salad'),
+    ('Напитки', '#2EC4B6', 'drinks'),
+)
+ADJECTIVES = (
+    'Домашний', 'Быстрый', 'Летний', 'Пряный', 'Нежный', 'Острый',
+    'Бабушкин', 'Постный', 'Праздничный', 'Сытный', 'Лёгкий', 'Осенний',
+)
+DISHES = (
+    'суп', 'салат', 'пирог', 'омлет', 'плов', 'рагу', 'борщ', 'десерт',
+    'гуляш', 'соус', 'пудинг', 'бульон', 'кекс', 'ризотто', 'смузи',
+)
+SENTENCES = (
+    'Нарежьте все ингредиенты небольшими кусочками.',
+    'Разогрейте сковороду и добавьте немного масла.',
+    'Готовьте на среднем огне, периодически помешивая.',
+    'Посолите и поперчите по вкусу.',
+    'Подавайте горячим, украсив зеленью.',
+    'Дайте блюду настояться несколько минут.',
+    'Выпекайте в разогретой духовке до золотистой корочки.',
+    'Смешайте всё в глубокой миске до однородности.',
+)
+
+
+class Zipf:
+    """
+    Выбор элементов с частотами по закону Ципфа.
+    Элементы перемешиваются, чтобы популярными оказывались случайные.
+    """
+
+    def __init__(self, rng, items, exponent):
+        self.rng = rng
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.cumulative = list(accumulate(
+            1 / rank ** exponent for rank in range(1, len(self.items) + 1)
+        ))
+
+    def choice(self):
+        point = self.rng.random() * self.cumulative[-1]
+        return self.items[
+            min(bisect(self.cumulative, point), len(self.items) - 1)
+        ]
+
+    def sample(self, count, exclude=None):
+        """До `count` различных элементов, кроме `exclude`."""
+        count = min(count, len(self.items) - (exclude is not None))
+        chosen = set()
+        attempts = count * 10
+        while len(chosen) < count and attempts:
+            item = self.choice()
+            if item != exclude:
+                chosen.add(item)
+            attempts -= 1
+        return chosen
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерация синтетических данных для нагрузочного тестирования: '
+        'пользователи, рецепты, избранное, корзины и подписки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--favorites', type=int, default=10,
+            help='Среднее число избранных рецептов у пользователя'
+        )
+        parser.add_argument(
+            '--cart', type=int, default=3,
+            help='Среднее число рецептов в корзине у пользователя'
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=5,
+            help='Среднее число подписок у пользователя'
+        )
+        parser.add_argument(
+            '--images', type=int, default=20,
+            help='Сколько картинок сгенерировать для всех рецептов'
+        )
+        parser.add_argument(
+            '--zipf', type=float, default=1.1,
+            help='Показатель распределения Ципфа'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='gen')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix!r} уже есть, '
+                'укажите другой --prefix.'
+            )
+        if not Ingredient.objects.exists():
+            call_command('import_csv_command', verbosity=0)
+        rng = random.Random(options['seed'])
+        exponent = options['zipf']
+        started = time.monotonic()
+
+        with transaction.atomic():
+            tags = self.get_tags()
+            images = self.make_images(rng, options['images'], prefix)
+            users = self.insert_new(
+                User, self.users(prefix, options['users'])
+            )
+            authors = Zipf(rng, users, exponent)
+            recipes = self.insert_new(
+                Recipe, self.recipes(rng, options['recipes'], authors, images)
+            )
+            self.insert(
+                RecipeTag, ('recipe', 'tag'),
+                self.recipe_tags(rng, recipes, Zipf(rng, tags, exponent))
+            )
+            self.insert(
+                RecipeIngredient, ('recipe', 'ingredient', 'amount'),
+                self.recipe_ingredients(rng, recipes, Zipf(
+                    rng, Ingredient.objects.values_list('pk', flat=True),
+                    exponent
+                ))
+            )
+            popular = Zipf(rng, recipes, exponent)
+            self.insert(
+                Favorite, ('user', 'recipe'),
+                self.pairs(rng, users, popular, options['favorites'])
+            )
+            self.insert(
+                ShoppingCart, ('user', 'recipe'),
+                self.pairs(rng, users, popular, options['cart'])
+            )
+            Recipe.objects.filter(
+                pk__gte=recipes[0], pk__lte=recipes[-1]
+            ).recount()
+            self.insert(
+                Subscription, ('user', 'author'),
+                self.pairs(
+                    rng, users, authors, options['subscriptions'],
+                    exclude_self=True
+                )
+            )
+            self.insert(
+                FeedItem, ('user', 'recipe', 'pub_date'),
+                self.feed_items(users)
+            )
+            self.insert(
+                ShoppingListItem, ('user', 'ingredient', 'amount'),
+                ShoppingListItem.objects.live_totals(User.objects.filter(
+                    pk__gte=users[0], pk__lte=users[-1]
+                )).iterator(chunk_size=self.batch_size)
+            )
+
+        versions.bump_version(versions.TAGS)
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные сгенерированы за {time.monotonic() - started:.1f} с.'
+        ))
+
+    def insert(self, model, fields, rows):
+        """
+        Вставка кортежей пачками: COPY на PostgreSQL,
+        executemany на остальных базах.
+        """
+        started = time.monotonic()
+        table = connection.ops.quote_name(model._meta.db_table)
+        fields = [model._meta.get_field(name) for name in fields]
+        columns = ', '.join(
+            connection.ops.quote_name(field.column) for field in fields
+        )
+        prepare = [
+            (index, field) for index, field in enumerate(fields)
+            if isinstance(field, models.DateTimeField)
+        ]
+        count = 0
+        rows = iter(rows)
+        with connection.cursor() as cursor:
+            while True:
+                batch = list(islice(rows, self.batch_size))
+                if not batch:
+                    break
+                count += len(batch)
+                if connection.vendor == 'postgresql':
+                    buffer = io.StringIO()
+                    csv.writer(buffer).writerows(batch)
+                    buffer.seek(0)
+                    cursor.copy_expert(
+                        f'COPY {table} ({columns}) FROM STDIN '
+                        'WITH (FORMAT csv)', buffer
+                    )
+                    continue
+                if prepare:
+                    batch = [list(row) for row in batch]
+                    for row in batch:
+                        for index, field in prepare:
+                            row[index] = field.get_db_prep_save(
+                                row[index], connection
+                            )
+                placeholders = ', '.join(['%s'] * len(fields))
+                cursor.executemany(
+                    f'INSERT INTO {table} ({columns}) '
+                    f'VALUES ({placeholders})', batch
+                )
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'{model._meta.verbose_name_plural}: {count} строк, '
+            f'{count / elapsed if elapsed else 0:.0f} в с'
+        )
+
+    def insert_new(self, model, data):
+        """
+        Вставляет строки и возвращает id новых объектов.
+        Генерация идёт в одной транзакции, поэтому новые id идут подряд.
+        """
+        fields, rows = data
+        last = model.objects.aggregate(last=models.Max('pk'))['last'] or 0
+        self.insert(model, fields, rows)
+        return list(model.objects.filter(pk__gt=last).order_by(
+            'pk'
+        ).values_list('pk', flat=True))
+
+    def get_tags(self):
+        for name, color, slug in TAGS:
+            Tag.objects.get_or_create(
+                slug=slug, defaults={'name': name, 'color': color}
+            )
+        return list(Tag.objects.values_list('pk', flat=True))
+
+    def make_images(self, rng, count, prefix):
+        """Небольшой набор картинок, общий для всех рецептов."""
+        upload_to = Recipe._meta.get_field('image').upload_to
+        names = []
+        for number in range(max(count, 1)):
+            name = f'{upload_to}/{prefix}_{number}.jpg'
+            if not default_storage.exists(name):
+                image = Image.new('RGB', (480, 320), tuple(
+                    rng.randrange(256) for _ in range(3)
+                ))
+                draw = ImageDraw.Draw(image)
+                for _ in range(12):
+                    x, y = rng.randrange(480), rng.randrange(320)
+                    radius = rng.randrange(10, 80)
+                    draw.ellipse(
+                        (x - radius, y - radius, x + radius, y + radius),
+                        fill=tuple(rng.randrange(256) for _ in range(3))
+                    )
+                buffer = io.BytesIO()
+                image.save(buffer, 'JPEG', quality=80)
+                name = default_storage.save(name, ContentFile(
+                    buffer.getvalue()
+                ))
+            names.append(name)
+        return names
+
+    def users(self, prefix, count):
+        password = make_password(PASSWORD)
+        now = timezone.now()
+        fields = (
+            'username', 'email', 'first_name', 'last_name', 'password',
+            'is_superuser', 'is_staff', 'is_active', 'date_joined',
+        )
+        rows = (
+            (
+                f'{prefix}{number}', f'{prefix}{number}@example.com',
+                'Имя', f'Фамилия {number}', password,
+                False, False, True, now,
+            )
+            for number in range(count)
+        )
+        return fields, rows
+
+    def recipes(self, rng, count, authors, images):
+        now = timezone.now()
+        fields = (
+            'author', 'name', 'image', 'text', 'cooking_time', 'pub_date',
+            'favorites_count', 'shopping_cart_count',
+        )
+        rows = (
+            (
+                authors.choice(),
+                f'{rng.choice(ADJECTIVES)} {rng.choice(DISHES)} {number}',
+                rng.choice(images),
+                ' '.join(rng.sample(SENTENCES, rng.randint(2, 5))),
+                rng.randint(5, 180),
+                now - timedelta(seconds=rng.randrange(365 * 24 * 60 * 60)),
+                0, 0,
+            )
+            for number in range(count)
+        )
+        return fields, rows
+
+    def recipe_tags(self, rng, recipes, tags):
+        for recipe in recipes:
+            for tag in tags.sample(rng.randint(1, 3)):
+                yield recipe, tag
+
+    def recipe_ingredients(self, rng, recipes, ingredients):
+        for recipe in recipes:
+            for ingredient in ingredients.sample(rng.randint(3, 12)):
+                yield recipe, ingredient, rng.randint(1, 500)
+
+    def feed_items(self, users):
+        """Хронологии одним запросом на пачку подписчиков."""
+        popular = FeedItem.objects.popular_authors(refresh=True)
+        for start in range(0, len(users), FEED_BATCH_SIZE):
+            yield from FeedItem.objects.timelines(
+                users[start:start + FEED_BATCH_SIZE], popular
+            )
+
+    def pairs(self, rng, users, targets, average, exclude_self=False):
+        for user in users:
+            for target in targets.sample(
+                rng.randint(0, average * 2),
+                exclude=user if exclude_self else None
+            ):
+                yield user, target
@@ -1,38 +1,217 @@
 import csv
+import io
+import json
+import os
+import time
+from itertools import islice
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
+from recipes import constants, versions
 from recipes.models import Ingredient
 
+BATCH_SIZE = 1000
+READ_SIZE = 64 * 1024
+STAGING_TABLE = 'ingredient_staging'
+
+
+class DryRunRollback(Exception):
+    """Откат транзакции после пробного прогона."""
+
+
+def read_csv(source):
+    for row in csv.reader(source, delimiter=','):
+        yield row[:2] if len(row) >= 2 else None
+
+
+def skip_separators(buffer, position):
+    while position < len(buffer) and buffer[position] in ' \t\r\n,':
+        position += 1
+    return position
+
+
+def read_json(source):
+    """
+    Потоково читает JSON-массив объектов, не загружая файл целиком.
+    """
+    decoder = json.JSONDecoder()
+    buffer = source.read(READ_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив ингредиентов.')
+    buffer = buffer[1:]
+    while True:
+        chunk = source.read(READ_SIZE)
+        buffer += chunk
+        position = skip_separators(buffer, 0)
+        while position < len(buffer) and buffer[position] != ']':
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                break
+            yield (
+                [item.get('name'), item.get('measurement_unit')]
+                if isinstance(item, dict) else None
+            )
+            position = skip_separators(buffer, position)
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        buffer = buffer[position:]
+        if not chunk:
+            raise CommandError('Файл JSON обрезан или повреждён.')
+
+
+READERS = {'csv': read_csv, 'json': read_json}
+
 
 class Command(BaseCommand):
-    help = 'Загрузка ингредиентов в базу из файла csv.'
+    help = 'Загрузка ингредиентов в базу из файла csv или json.'
 
     def add_arguments(self, parser):
         parser.add_argument(
-            '--path', type=str, help='Путь к CSV-файлу с ингредиентами'
+            '--path', type=str,
+            help='Путь к CSV- или JSON-файлу с ингредиентами'
+        )
+        parser.add_argument(
+            '--format', choices=READERS, default=None,
+            help='Формат файла, по умолчанию определяется по расширению'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Сколько строк вставлять за раз'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Показать, что будет добавлено, не изменяя базу'
         )
 
     def handle(self, *args, **options):
         file_path = options['path']
         if not file_path:
             file_path = 'recipes/management/commands/data/ingredients.csv'
+        file_format = options['format'] or os.path.splitext(
+            file_path
+        )[1].lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {file_path}')
+        load = (
+            self.load_postgresql if connection.vendor == 'postgresql'
+            else self.load_portable
+        )
+
+        self.verbosity = options['verbosity']
+        self.started = time.monotonic()
+        self.read = self.created = 0
+        with open(file_path, 'r', encoding='utf-8') as source:
+            rows = self.clean(READERS[file_format](source))
+            try:
+                with transaction.atomic():
+                    load(rows, options['batch_size'], options['dry_run'])
+                    if options['dry_run']:
+                        raise DryRunRollback
+            except DryRunRollback:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Пробный прогон: строк {self.read}, '
+                    f'будет добавлено {self.created}.'
+                ))
+                return
+        versions.bump_version(versions.INGREDIENTS)
+        self.stdout.write(self.style.SUCCESS(
+            f'Ингредиенты успешно импортированы: строк {self.read}, '
+            f'добавлено {self.created}, {self.rate():.0f} строк в с.'
+        ))
+
+    def clean(self, rows):
+        for number, row in enumerate(rows, start=1):
+            self.read += 1
+            if (
+                not row or not all(isinstance(value, str) for value in row)
+                or not row[0].strip() or not row[1].strip()
+                or len(row[0]) > constants.MAX_INGREDIENT_NAME_LENGTH
+                or len(row[1]) > constants.MAX_MEASUREMENT_UNIT_LENGTH
+            ):
+                self.stderr.write(
+                    'Ошибка при импорте ингредиента {}: {}'.format(number, row)
+                )
+                continue
+            yield row[0].strip(), row[1].strip()
 
-        with open(file_path, 'r', encoding='utf-8') as csv_file:
-            csv_reader = csv.reader(csv_file, delimiter=',')
-            ingredients = []
-            for row in csv_reader:
-                try:
-                    ingredient = Ingredient(
-                        name=row[0],
-                        measurement_unit=row[1],
-                    )
-                    ingredients.append(ingredient)
-                except ValueError:
-                    self.stderr.write(
-                        'Ошибка при импорте ингредиента: {}'.format(row)
-                    )
-            Ingredient.objects.bulk_create(ingredients)
-            self.stdout.write(self.style.SUCCESS(
-                'Ингредиенты успешно импортированы.')
+    def batches(self, rows, batch_size):
+        rows = iter(rows)
+        while True:
+            batch = set(islice(rows, batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def load_postgresql(self, rows, batch_size, dry_run):
+        """
+        COPY во временную таблицу и одна вставка с ON CONFLICT DO NOTHING.
+        """
+        table = Ingredient._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE {STAGING_TABLE} '
+                '(name text, measurement_unit text) ON COMMIT DROP'
+            )
+            for batch in self.batches(rows, batch_size):
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f'COPY {STAGING_TABLE} (name, measurement_unit) '
+                    'FROM STDIN WITH (FORMAT csv)', buffer
+                )
+                self.report()
+            if dry_run:
+                cursor.execute(
+                    f'SELECT DISTINCT s.name, s.measurement_unit '
+                    f'FROM {STAGING_TABLE} s LEFT JOIN {table} i '
+                    'ON i.name = s.name '
+                    'AND i.measurement_unit = s.measurement_unit '
+                    'WHERE i.id IS NULL ORDER BY s.name'
+                )
+                for row in cursor:
+                    self.diff(row)
+                return
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                f'SELECT DISTINCT name, measurement_unit FROM {STAGING_TABLE} '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING'
             )
+            self.created = cursor.rowcount
+
+    def load_portable(self, rows, batch_size, dry_run):
+        """Пачки bulk_create с игнорированием уже существующих строк."""
+        count = Ingredient.objects.count()
+        for batch in self.batches(rows, batch_size):
+            existing = set(Ingredient.objects.filter(
+                name__in={name for name, _ in batch}
+            ).order_by().values_list('name', 'measurement_unit'))
+            new = sorted(batch - existing)
+            if dry_run:
+                for row in new:
+                    self.diff(row)
+            else:
+                Ingredient.objects.bulk_create(
+                    (
+                        Ingredient(name=name, measurement_unit=unit)
+                        for name, unit in new
+                    ),
+                    ignore_conflicts=True
+                )
+            self.report()
+        if not dry_run:
+            self.created = Ingredient.objects.count() - count
+
+    def diff(self, row):
+        self.created += 1
+        if self.verbosity > 1:
+            self.stdout.write('+ {}, {}'.format(*row))
+
+    def report(self):
+        self.stderr.write(f'{self.read} строк, {self.rate():.0f} в с')
+
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.read / elapsed if elapsed else 0
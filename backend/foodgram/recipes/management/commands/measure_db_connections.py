@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+ITERATIONS = 200
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение запроса через новое соединение и через постоянное: '
+        'сколько стоит подключение к базе на каждый запрос.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations', type=int, default=ITERATIONS,
+            help='Число повторов для каждого режима'
+        )
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        iterations = options['iterations']
+
+        fresh = self.measure(connection, iterations, reconnect=True)
+        persistent = self.measure(connection, iterations, reconnect=False)
+        self.stdout.write(
+            f'Новое соединение: {fresh:.3f} мс на запрос\n'
+            f'Постоянное соединение: {persistent:.3f} мс на запрос\n'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Экономия на запрос: {fresh - persistent:.3f} мс'
+        ))
+
+    def measure(self, connection, iterations, reconnect):
+        connection.close()
+        connection.ensure_connection()
+        started = time.perf_counter()
+        for _ in range(iterations):
+            if reconnect:
+                connection.close()
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+        connection.close()
+        return (time.perf_counter() - started) * 1000 / iterations
@@ -0,0 +1,41 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import FeedItem
+from users.models import Subscription
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Пересборка хронологий ленты подписок по текущим подпискам.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Сколько пользователей пересобирать в одной транзакции'
+        )
+
+    def handle(self, *args, **options):
+        popular = FeedItem.objects.popular_authors(refresh=True)
+        FeedItem.objects.exclude(
+            user_id__in=Subscription.objects.values('user_id')
+        ).delete()
+        followers = iter(list(Subscription.objects.order_by(
+            'user_id'
+        ).values_list('user_id', flat=True).distinct()))
+        rebuilt = 0
+        while True:
+            batch = list(islice(followers, options['batch_size']))
+            if not batch:
+                break
+            with transaction.atomic():
+                FeedItem.objects.rebuild(batch, popular)
+            rebuilt += len(batch)
+            self.stderr.write(f'{rebuilt} пользователей')
+        self.stdout.write(self.style.SUCCESS(
+            f'Хронологии пересобраны: пользователей {rebuilt}, '
+            f'популярных авторов {len(popular)}.'
+        ))
@@ -0,0 +1,85 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересборка сводных списков покупок из корзин '
+        'и проверка их соответствия.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить списки, ничего не изменяя'
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            self.rebuild()
+
+        mismatches = 0
+        for key, stored, live in self.compare():
+            mismatches += 1
+            self.stderr.write(
+                'Пользователь {}, ингредиент {}: в списке {}, '
+                'в корзине {}'.format(*key, stored, live)
+            )
+        if mismatches:
+            raise CommandError(f'Найдено расхождений: {mismatches}')
+        self.stdout.write(self.style.SUCCESS(
+            'Списки покупок совпадают с корзинами.'
+        ))
+
+    @transaction.atomic
+    def rebuild(self):
+        ShoppingListItem.objects.all().delete()
+        ShoppingListItem.objects.bulk_create(
+            (
+                ShoppingListItem(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    amount=total_amount,
+                )
+                for user_id, ingredient_id, total_amount
+                in ShoppingListItem.objects.live_totals().iterator()
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        self.stdout.write('Списки покупок пересобраны.')
+
+    def compare(self):
+        """
+        Сравнивает сохранённые списки с подсчётом по корзинам.
+        Оба набора читаются упорядоченными, поэтому память не растёт
+        с размером таблиц. Возвращает расхождения
+        ((user_id, ingredient_id), в списке, в корзине).
+        """
+        stored = ShoppingListItem.objects.values_list(
+            'user_id', 'ingredient_id', 'amount'
+        ).order_by('user_id', 'ingredient_id').iterator()
+        live = ShoppingListItem.objects.live_totals().order_by(
+            'recipe__shopping_carts__user_id', 'ingredient_id'
+        ).iterator()
+
+        stored_row = next(stored, None)
+        live_row = next(live, None)
+        while stored_row is not None or live_row is not None:
+            stored_key = stored_row[:2] if stored_row else None
+            live_key = live_row[:2] if live_row else None
+            if stored_key == live_key:
+                if stored_row[2] != live_row[2]:
+                    yield stored_key, stored_row[2], live_row[2]
+                stored_row = next(stored, None)
+                live_row = next(live, None)
+            elif live_key is None or (
+                    stored_key is not None and stored_key < live_key):
+                yield stored_key, stored_row[2], 0
+                stored_row = next(stored, None)
+            else:
+                yield live_key, 0, live_row[2]
+                live_row = next(live, None)
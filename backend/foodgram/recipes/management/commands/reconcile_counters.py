@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Q
+
+from recipes.models import Recipe
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверка и исправление счётчиков избранного и списков покупок '
+        'у рецептов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только найти расхождения, ничего не изменяя'
+        )
+
+    def handle(self, *args, **options):
+        drifted = []
+        for pk, name, *counts in self.find_drift():
+            drifted.append(pk)
+            self.stderr.write(
+                'Рецепт {} «{}»: в избранном {} вместо {}, '
+                'в списках покупок {} вместо {}'.format(pk, name, *counts)
+            )
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('Счётчики совпадают.'))
+            return
+        if options['check']:
+            raise CommandError(f'Найдено расхождений: {len(drifted)}')
+        for start in range(0, len(drifted), BATCH_SIZE):
+            Recipe.objects.filter(
+                pk__in=drifted[start:start + BATCH_SIZE]
+            ).recount()
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено рецептов: {len(drifted)}.'
+        ))
+
+    def find_drift(self):
+        """
+        Рецепты, у которых счётчики не совпадают с таблицами связей:
+        (id, название, favorites_count, факт, shopping_cart_count, факт).
+        """
+        actual = Recipe.objects.actual_counts()
+        drift = Q()
+        for field in actual:
+            drift |= ~Q(**{field: F(f'actual_{field}')})
+        return Recipe.objects.annotate(**{
+            f'actual_{field}': expression
+            for field, expression in actual.items()
+        }).filter(drift).order_by('pk').values_list(
+            'pk', 'name',
+            'favorites_count', 'actual_favorites_count',
+            'shopping_cart_count', 'actual_shopping_cart_count',
+        ).iterator()
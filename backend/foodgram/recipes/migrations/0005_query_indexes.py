@@ -0,0 +1,46 @@
+# Generated by Django 3.2 on 2026-10-18 18:11
+
+from django.db import migrations, models
+
+
+def create_ingredient_name_index(apps, schema_editor):
+    # istartswith в PostgreSQL превращается в UPPER(name::text) LIKE ...,
+    # такой запрос использует только функциональный индекс с
+    # text_pattern_ops. В SQLite LIKE с ESCAPE индексы не использует.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS ingredient_name_upper_idx '
+        'ON recipes_ingredient (UPPER(name::text) text_pattern_ops)'
+    )
+
+
+def drop_ingredient_name_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS ingredient_name_upper_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_shopping_list_item'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date', '-id'], name='recipe_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipetag',
+            index=models.Index(fields=['tag', 'recipe'], name='recipetag_tag_recipe_idx'),
+        ),
+        migrations.RunPython(
+            create_ingredient_name_index, drop_ingredient_name_index
+        ),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 3.2 on 2026-10-18 21:40
+
+from django.db import migrations
+
+# Колонка search_vector и таблица recipes_recipe_fts не описаны в модели:
+# Django не выбирает их в обычных запросах, а заполняют их триггеры
+# в самой базе, поэтому индекс не отстаёт и после bulk_create, COPY
+# и сырых INSERT.
+POSTGRESQL_INSTALL = (
+    'ALTER TABLE recipes_recipe '
+    'ADD COLUMN IF NOT EXISTS search_vector tsvector',
+    """
+    CREATE OR REPLACE FUNCTION recipes_recipe_search_vector()
+    RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := setweight(
+            to_tsvector('russian', coalesce(NEW.name, '')), 'A'
+        ) || setweight(
+            to_tsvector('russian', coalesce(NEW.text, '')), 'B'
+        );
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger '
+    'ON recipes_recipe',
+    'CREATE TRIGGER recipes_recipe_search_vector_trigger '
+    'BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe '
+    'FOR EACH ROW EXECUTE FUNCTION recipes_recipe_search_vector()',
+    'UPDATE recipes_recipe SET name = name WHERE search_vector IS NULL',
+    'CREATE INDEX IF NOT EXISTS recipe_search_vector_idx '
+    'ON recipes_recipe USING GIN (search_vector)',
+)
+POSTGRESQL_UNINSTALL = (
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger '
+    'ON recipes_recipe',
+    'DROP FUNCTION IF EXISTS recipes_recipe_search_vector()',
+    'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector',
+)
+# FTS5 с внешним содержимым: в таблице только индекс,
+# сам текст берётся из recipes_recipe.
+SQLITE_INSTALL = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS recipes_recipe_fts USING fts5('
+    "name, text, content='recipes_recipe', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    'CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_insert '
+    'AFTER INSERT ON recipes_recipe '
+    'BEGIN INSERT INTO recipes_recipe_fts (rowid, name, text) '
+    'VALUES (new.id, new.name, new.text); END',
+    'CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_delete '
+    'AFTER DELETE ON recipes_recipe '
+    'BEGIN INSERT INTO recipes_recipe_fts '
+    '(recipes_recipe_fts, rowid, name, text) '
+    "VALUES ('delete', old.id, old.name, old.text); END",
+    'CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_update '
+    'AFTER UPDATE OF name, text ON recipes_recipe '
+    'BEGIN INSERT INTO recipes_recipe_fts '
+    '(recipes_recipe_fts, rowid, name, text) '
+    "VALUES ('delete', old.id, old.name, old.text); "
+    'INSERT INTO recipes_recipe_fts (rowid, name, text) '
+    'VALUES (new.id, new.name, new.text); END',
+    "INSERT INTO recipes_recipe_fts (recipes_recipe_fts) VALUES ('rebuild')",
+)
+SQLITE_UNINSTALL = (
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_insert',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_delete',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_update',
+    'DROP TABLE IF EXISTS recipes_recipe_fts',
+)
+STATEMENTS = {
+    'postgresql': (POSTGRESQL_INSTALL, POSTGRESQL_UNINSTALL),
+    'sqlite': (SQLITE_INSTALL, SQLITE_UNINSTALL),
+}
+
+
+def create_search_index(apps, schema_editor):
+    # PostgreSQL: колонка tsvector с весами A (название) и B (описание),
+    # триггер и GIN-индекс. SQLite: таблица FTS5 с триггерами.
+    install, _ = STATEMENTS.get(schema_editor.connection.vendor, ((), ()))
+    for statement in install:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    _, uninstall = STATEMENTS.get(schema_editor.connection.vendor, ((), ()))
+    for statement in uninstall:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
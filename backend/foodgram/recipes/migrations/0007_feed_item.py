@@ -0,0 +1,60 @@
+# Generated by Django 3.2 on 2026-10-18 18:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+FEED_MAX_ITEMS = 500
+
+
+def fill_feeds(apps, schema_editor):
+    Subscription = apps.get_model('users', 'Subscription')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FeedItem = apps.get_model('recipes', 'FeedItem')
+    followers = Subscription.objects.order_by('user_id').values_list(
+        'user_id', flat=True
+    ).distinct()
+    for user_id in list(followers):
+        FeedItem.objects.bulk_create(
+            FeedItem(user_id=user_id, recipe_id=pk, pub_date=pub_date)
+            for pk, pub_date in Recipe.objects.filter(
+                author__subscribing__user_id=user_id
+            ).order_by('-pub_date', '-id').values_list(
+                'pk', 'pub_date'
+            )[:FEED_MAX_ITEMS]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0006_recipe_search'),
+        ('users', '0003_alter_user_username'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_items', to='recipes.recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_items', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Рецепт в ленте',
+                'verbose_name_plural': 'Ленты подписок',
+                'ordering': ['user'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feeditem',
+            index=models.Index(fields=['user', '-pub_date', '-recipe'], name='feeditem_user_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feeditem',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_user_recipe_feed'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
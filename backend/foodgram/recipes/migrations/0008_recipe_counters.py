@@ -0,0 +1,89 @@
+# Generated by Django 3.2 on 2026-10-18 18:41
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# Триггеры поиска из 0006_recipe_search для SQLite.
+SQLITE_TRIGGERS = (
+    'CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_insert '
+    'AFTER INSERT ON recipes_recipe '
+    'BEGIN INSERT INTO recipes_recipe_fts (rowid, name, text) '
+    'VALUES (new.id, new.name, new.text); END',
+    'CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_delete '
+    'AFTER DELETE ON recipes_recipe '
+    'BEGIN INSERT INTO recipes_recipe_fts '
+    '(recipes_recipe_fts, rowid, name, text) '
+    "VALUES ('delete', old.id, old.name, old.text); END",
+    'CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_update '
+    'AFTER UPDATE OF name, text ON recipes_recipe '
+    'BEGIN INSERT INTO recipes_recipe_fts '
+    '(recipes_recipe_fts, rowid, name, text) '
+    "VALUES ('delete', old.id, old.name, old.text); "
+    'INSERT INTO recipes_recipe_fts (rowid, name, text) '
+    'VALUES (new.id, new.name, new.text); END',
+)
+
+
+def count_related(model):
+    return Coalesce(Subquery(
+        model.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            total=Count('id')
+        ).values('total')
+    ), 0)
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(
+        favorites_count=count_related(apps.get_model('recipes', 'Favorite')),
+        shopping_cart_count=count_related(
+            apps.get_model('recipes', 'ShoppingCart')
+        ),
+    )
+
+
+def reinstall_search_triggers(apps, schema_editor):
+    # SQLite добавляет колонки, пересоздавая таблицу, и теряет
+    # триггеры поиска. PostgreSQL меняет таблицу на месте.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in SQLITE_TRIGGERS:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_feed_item'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            migrations.RunPython.noop, reinstall_search_triggers
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-id'], name='recipe_favorites_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-shopping_cart_count', '-id'], name='recipe_cart_count_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+        migrations.RunPython(
+            reinstall_search_triggers, migrations.RunPython.noop
+        ),
+    ]
@@ -1,10 +1,20 @@
+from collections import defaultdict
+from heapq import merge
+from itertools import islice
+
 from colorfield.fields import ColorField
+from django.core.cache import cache
 from django.core.validators import MinValueValidator
-from django.db import models
-from django.db.models import UniqueConstraint
+from django.db import models, transaction
+from django.db.models import (Count, F, OuterRef, Prefetch, Q, Subquery, Sum,
+                              UniqueConstraint, Window)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, Greatest, RowNumber
 
 from recipes import constants
-from users.models import User
+from users.models import Subscription, User
+
+POPULAR_AUTHORS_KEY = 'feed:popular-authors'
 
 
 class Tag(models.Model):
@@ -48,6 +58,73 @@ class Ingredient(models.Model):
         return f'{self.name} {self.measurement_unit}'
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Кверисет рецептов, оптимизированный для чтения."""
+
+    def for_read(self):
+        """
+        Рецепты вместе с автором, тегами и ингредиентами
+        за фиксированное число запросов.
+        """
+        return self.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'recipes_ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+        )
+
+    def latest_per_author(self, limit):
+        """
+        Не более `limit` последних рецептов каждого автора одним запросом.
+        Используется для prefetch рецептов в подписках.
+
+        Рецепты нумеруются ROW_NUMBER() внутри автора в одном проходе
+        по индексу recipe_author_pub_date_idx, без подзапроса на каждую
+        строку. Фильтры, заданные до вызова, попадают в этот подзапрос,
+        поэтому авторов нужно отобрать заранее.
+        """
+        ranked = self.order_by().annotate(position=Window(
+            RowNumber(), partition_by=[F('author_id')],
+            order_by=[F('pub_date').desc(), F('id').desc()]
+        )).values('pk', 'position')
+        sql, params = ranked.query.sql_with_params()
+        return self.filter(pk__in=RawSQL(
+            f'SELECT ranked.id FROM ({sql}) ranked '
+            'WHERE ranked.position <= %s', (*params, limit)
+        ))
+
+    def add_to_counter(self, field, delta):
+        """
+        Атомарно меняет счётчик (favorites_count или shopping_cart_count)
+        у рецептов кверисета, не опуская его ниже нуля.
+        """
+        return self.update(**{field: Greatest(F(field) + delta, 0)})
+
+    def recount(self):
+        """Пересчитывает счётчики рецептов кверисета по таблицам связей."""
+        return self.update(**self.actual_counts())
+
+    @staticmethod
+    def actual_counts():
+        """Выражения {поле счётчика: число строк в таблице связей}."""
+        return {
+            field: Coalesce(Subquery(
+                model.objects.filter(
+                    recipe=OuterRef('pk')
+                ).order_by().values('recipe').annotate(
+                    total=Count('id')
+                ).values('total')
+            ), 0)
+            for field, model in (
+                ('favorites_count', Favorite),
+                ('shopping_cart_count', ShoppingCart),
+            )
+        }
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User, on_delete=models.CASCADE,
@@ -78,11 +155,36 @@ class Recipe(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True
     )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном', default=0, editable=False
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        'В списках покупок', default=0, editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-id'],
+                name='recipe_favorites_count_idx'
+            ),
+            models.Index(
+                fields=['-shopping_cart_count', '-id'],
+                name='recipe_cart_count_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name} {self.text}'
@@ -106,6 +208,11 @@ class RecipeTag(models.Model):
                 name='unique_recipe_tag'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['tag', 'recipe'], name='recipetag_tag_recipe_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.recipe} {self.tag}'
@@ -194,3 +301,354 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f"{self.recipe} {self.user}"
+
+
+class ShoppingListQuerySet(models.QuerySet):
+    """
+    Поддержка сводного списка покупок в актуальном состоянии.
+    """
+
+    def apply_deltas(self, user_ids, deltas):
+        """
+        Изменяет суммарное количество ингредиентов у пользователей.
+
+        user_ids - id пользователей, чьи списки нужно обновить
+        deltas - словарь {id ингредиента: изменение количества}
+        Позиции с нулевым или отрицательным количеством удаляются.
+
+        Недостающие позиции сначала вставляются с нулевым количеством,
+        конфликты с параллельной вставкой игнорируются. Затем все
+        позиции увеличиваются через F(), поэтому одновременные
+        изменения одного списка складываются, а не теряются.
+        """
+        user_ids = list(user_ids)
+        deltas = {
+            ingredient_id: delta
+            for ingredient_id, delta in deltas.items() if delta
+        }
+        if not user_ids or not deltas:
+            return
+        items = self.filter(user_id__in=user_ids)
+        # Один порядок блокировки строк во всех транзакциях.
+        ingredient_ids = sorted(deltas)
+        added = [
+            ingredient_id for ingredient_id in ingredient_ids
+            if deltas[ingredient_id] > 0
+        ]
+        with transaction.atomic(savepoint=False):
+            existing = set(items.filter(
+                ingredient_id__in=added
+            ).values_list('user_id', 'ingredient_id'))
+            self.bulk_create(
+                (
+                    self.model(
+                        user_id=user_id, ingredient_id=ingredient_id,
+                        amount=0
+                    )
+                    for user_id in sorted(user_ids)
+                    for ingredient_id in added
+                    if (user_id, ingredient_id) not in existing
+                ),
+                ignore_conflicts=True
+            )
+            for ingredient_id in ingredient_ids:
+                items.filter(ingredient_id=ingredient_id).update(
+                    amount=F('amount') + deltas[ingredient_id]
+                )
+            items.filter(amount__lte=0).delete()
+
+    def add_recipe(self, user_ids, recipe):
+        """Добавляет ингредиенты рецепта в списки пользователей."""
+        self.add_recipes(user_ids, [recipe.pk])
+
+    def add_recipes(self, user_ids, recipe_ids):
+        """Добавляет ингредиенты нескольких рецептов в списки."""
+        self.apply_recipes(user_ids, recipe_ids, 1)
+
+    def apply_recipes(self, user_ids, recipe_ids, sign):
+        with transaction.atomic(savepoint=False):
+            self.apply_deltas(user_ids, {
+                ingredient_id: sign * amount
+                for ingredient_id, amount
+                in self.locked_amounts(recipe_ids).items()
+            })
+
+    def locked_amounts(self, recipe_ids):
+        """
+        Суммы ингредиентов рецептов. Рецепты блокируются до конца
+        транзакции, как и в RecipeWriteSerializer.update: их ингредиенты
+        не изменятся между чтением и применением к спискам.
+        """
+        list(Recipe.objects.select_for_update().filter(
+            pk__in=recipe_ids
+        ).order_by('pk').values_list('pk', flat=True))
+        return self.recipes_amounts(recipe_ids)
+
+    @staticmethod
+    def recipes_amounts(recipe_ids):
+        """Словарь {id ингредиента: сумма по рецептам}."""
+        return dict(RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by().values('ingredient_id').annotate(
+            total=Sum('amount')
+        ).values_list('ingredient_id', 'total'))
+
+    def live_totals(self, users=None):
+        """
+        Суммы ингредиентов, посчитанные по корзинам напрямую.
+        Используется для пересборки и проверки списков.
+        users - необязательный кверисет пользователей для отбора
+        """
+        carts = Q(recipe__shopping_carts__user__isnull=False)
+        if users is not None:
+            carts &= Q(recipe__shopping_carts__user__in=users)
+        return RecipeIngredient.objects.filter(carts).values(
+            'recipe__shopping_carts__user', 'ingredient'
+        ).annotate(
+            total_amount=Sum('amount')
+        ).values_list(
+            'recipe__shopping_carts__user', 'ingredient', 'total_amount'
+        ).order_by()
+
+
+class ShoppingListItem(models.Model):
+    """
+    Сводный список покупок пользователя.
+
+    Хранит уже просуммированное количество каждого ингредиента по всем
+    рецептам из корзины. Изменения корзины применяют сигналы ShoppingCart
+    (recipes/signals.py), изменения ингредиентов рецепта —
+    RecipeWriteSerializer.update.
+    """
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    amount = models.IntegerField('Количество')
+
+    objects = ShoppingListQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['user']
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списков покупок'
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_user_ingredient_shopping_list'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user} {self.ingredient} - {self.amount}'
+
+
+class FeedQuerySet(models.QuerySet):
+    """
+    Хронологии ленты подписок (fan-out on write).
+
+    При публикации рецепт раскладывается в хронологии подписчиков
+    автора. Рецепты популярных авторов не раскладываются, лента
+    подмешивает их при чтении. Хронология хранит не больше
+    FEED_MAX_ITEMS последних рецептов.
+    """
+
+    def popular_authors(self, refresh=False):
+        """
+        id авторов, у которых больше FEED_POPULAR_FOLLOWERS подписчиков.
+        Пересчитывается раз в FEED_POPULAR_CACHE_TIMEOUT или сразу
+        при refresh=True.
+        """
+        authors = None if refresh else cache.get(POPULAR_AUTHORS_KEY)
+        if authors is None:
+            authors = frozenset(Subscription.objects.order_by().values(
+                'author_id'
+            ).annotate(
+                followers=Count('id')
+            ).filter(
+                followers__gt=constants.FEED_POPULAR_FOLLOWERS
+            ).values_list('author_id', flat=True))
+            cache.set(
+                POPULAR_AUTHORS_KEY, authors,
+                constants.FEED_POPULAR_CACHE_TIMEOUT
+            )
+        return authors
+
+    def fan_out(self, recipes):
+        """Добавляет рецепты в хронологии подписчиков их авторов пачками."""
+        popular = self.popular_authors()
+        recipes = [
+            recipe for recipe in recipes if recipe.author_id not in popular
+        ]
+        if not recipes:
+            return
+        followers = defaultdict(list)
+        for author_id, user_id in Subscription.objects.filter(
+            author_id__in={recipe.author_id for recipe in recipes}
+        ).order_by().values_list('author_id', 'user_id'):
+            followers[author_id].append(user_id)
+        items = (
+            self.model(
+                user_id=user_id, recipe=recipe, pub_date=recipe.pub_date
+            )
+            for recipe in recipes
+            for user_id in followers[recipe.author_id]
+        )
+        while True:
+            batch = list(islice(items, constants.FEED_FANOUT_BATCH_SIZE))
+            if not batch:
+                break
+            self.bulk_create(batch, ignore_conflicts=True)
+            # Каждая публикация проверяет размер хронологий только у
+            # части подписчиков, поэтому хронология может превысить
+            # предел примерно на FEED_TRIM_EVERY рецептов.
+            self.trim(sorted({
+                item.user_id for item in batch
+                if item.user_id % constants.FEED_TRIM_EVERY
+                == item.recipe.pk % constants.FEED_TRIM_EVERY
+            }))
+
+    def follow(self, user_id, author_ids):
+        """Добавляет в хронологию последние рецепты новых авторов."""
+        author_ids = set(author_ids) - self.popular_authors()
+        if not author_ids:
+            return
+        self.bulk_create(
+            (
+                self.model(user_id=user_id, recipe_id=pk, pub_date=pub_date)
+                for pk, pub_date in Recipe.objects.filter(
+                    author_id__in=author_ids
+                ).order_by('-pub_date', '-id').values_list(
+                    'pk', 'pub_date'
+                )[:constants.FEED_MAX_ITEMS]
+            ),
+            ignore_conflicts=True
+        )
+        self.trim([user_id])
+
+    def unfollow(self, user_ids, author_ids):
+        """Убирает из хронологий пользователей рецепты авторов."""
+        self.filter(
+            user_id__in=user_ids, recipe__author_id__in=author_ids
+        ).delete()
+
+    def trim(self, user_ids):
+        """Удаляет из хронологий рецепты сверх FEED_MAX_ITEMS."""
+        if not user_ids:
+            return
+        overfull = self.filter(user_id__in=user_ids).order_by().values(
+            'user_id'
+        ).annotate(
+            items=Count('id')
+        ).filter(
+            items__gt=constants.FEED_MAX_ITEMS
+        ).values_list('user_id', flat=True)
+        for user_id in overfull:
+            items = self.filter(user_id=user_id)
+            pub_date, recipe_id = items.order_by(
+                '-pub_date', '-recipe_id'
+            ).values_list(
+                'pub_date', 'recipe_id'
+            )[constants.FEED_MAX_ITEMS]
+            items.filter(
+                Q(pub_date__lt=pub_date)
+                | Q(pub_date=pub_date, recipe_id__lte=recipe_id)
+            ).delete()
+
+    def timelines(self, user_ids, popular):
+        """
+        Строки хронологий (user_id, id рецепта, pub_date) для нескольких
+        пользователей, собранные по текущим подпискам двумя запросами.
+
+        Берутся не больше FEED_MAX_ITEMS последних рецептов каждого
+        автора (latest_per_author), и списки авторов, на которых
+        подписан пользователь, сливаются в памяти по убыванию даты.
+        """
+        following = defaultdict(list)
+        for user_id, author_id in Subscription.objects.filter(
+            user_id__in=user_ids
+        ).exclude(
+            author_id__in=popular
+        ).order_by().values_list('user_id', 'author_id'):
+            following[user_id].append(author_id)
+        authors = {
+            author_id for author_ids in following.values()
+            for author_id in author_ids
+        }
+        latest = defaultdict(list)
+        for author_id, pk, pub_date in Recipe.objects.filter(
+            author_id__in=authors
+        ).latest_per_author(constants.FEED_MAX_ITEMS).order_by(
+            'author_id', '-pub_date', '-id'
+        ).values_list('author_id', 'pk', 'pub_date'):
+            latest[author_id].append((pub_date, pk))
+        for user_id, author_ids in following.items():
+            recipes = merge(
+                *(latest[author_id] for author_id in author_ids),
+                reverse=True
+            )
+            for pub_date, pk in islice(recipes, constants.FEED_MAX_ITEMS):
+                yield user_id, pk, pub_date
+
+    def rebuild(self, user_ids, popular=None):
+        """Собирает хронологии пользователей заново."""
+        if popular is None:
+            popular = self.popular_authors()
+        self.filter(user_id__in=user_ids).delete()
+        items = (
+            self.model(user_id=user_id, recipe_id=pk, pub_date=pub_date)
+            for user_id, pk, pub_date in self.timelines(user_ids, popular)
+        )
+        while True:
+            batch = list(islice(items, constants.FEED_FANOUT_BATCH_SIZE))
+            if not batch:
+                break
+            self.bulk_create(batch)
+
+
+class FeedItem(models.Model):
+    """
+    Рецепт в хронологии ленты подписок пользователя.
+    Дата публикации продублирована для сортировки по индексу.
+    """
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Рецепт'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    objects = FeedQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['user']
+        verbose_name = 'Рецепт в ленте'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_user_recipe_feed'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feeditem_user_pub_date_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user} {self.recipe}'
@@ -0,0 +1,92 @@
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import OrderBy, RawSQL
+
+# Та же конфигурация, что в триггере из 0006_recipe_search.
+SEARCH_CONFIG = 'russian'
+NAME_WEIGHT = 10.0
+TEXT_WEIGHT = 1.0
+WORD = re.compile(r'\w+')
+
+# Колонку search_vector (PostgreSQL) и таблицу recipes_recipe_fts
+# (SQLite) с триггерами создаёт миграция 0006_recipe_search. SQLite
+# пересоздаёт таблицу при изменении схемы и теряет триггеры, поэтому
+# check_query_plans проверяет, что они на месте.
+SEARCH_OBJECTS = {
+    'postgresql': ('recipes_recipe_search_vector_trigger',),
+    'sqlite': (
+        'recipes_recipe_fts', 'recipes_recipe_fts_insert',
+        'recipes_recipe_fts_delete', 'recipes_recipe_fts_update',
+    ),
+}
+EXISTING_OBJECTS = {
+    'postgresql': (
+        'SELECT tgname FROM pg_trigger '
+        "WHERE tgrelid = 'recipes_recipe'::regclass AND NOT tgisinternal"
+    ),
+    'sqlite': (
+        'SELECT name FROM sqlite_master '
+        "WHERE type IN ('table', 'trigger')"
+    ),
+}
+
+
+def missing_search_objects(connection):
+    """Триггеры и таблицы поиска, которых нет в базе."""
+    expected = SEARCH_OBJECTS.get(connection.vendor, ())
+    if not expected:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(EXISTING_OBJECTS[connection.vendor])
+        existing = {name for name, in cursor.fetchall()}
+    return [name for name in expected if name not in existing]
+
+
+def fts5_query(query):
+    """
+    Запрос FTS5 из пользовательской строки: каждое слово в кавычках
+    и с поиском по началу слова — грубая замена стеммингу.
+    """
+    return ' '.join(f'"{word}"*' for word in WORD.findall(query))
+
+
+def search_recipes(queryset, query):
+    """
+    Рецепты, подходящие под поисковую строку, по убыванию релевантности.
+    Совпадение в названии весит больше, чем в описании.
+    """
+    if connection.vendor == 'postgresql':
+        tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+        match = RawSQL(
+            f'recipes_recipe.search_vector @@ {tsquery}', (query,),
+            output_field=BooleanField()
+        )
+        rank = RawSQL(
+            f'ts_rank(recipes_recipe.search_vector, {tsquery})', (query,),
+            output_field=FloatField()
+        )
+    elif connection.vendor == 'sqlite':
+        query = fts5_query(query)
+        if not query:
+            return queryset.none()
+        match = Q(pk__in=RawSQL(
+            'SELECT rowid FROM recipes_recipe_fts '
+            'WHERE recipes_recipe_fts MATCH %s', (query,)
+        ))
+        # bm25 тем меньше, чем лучше совпадение.
+        rank = RawSQL(
+            f'(SELECT -bm25(recipes_recipe_fts, {NAME_WEIGHT}, '
+            f'{TEXT_WEIGHT}) FROM recipes_recipe_fts '
+            'WHERE recipes_recipe_fts MATCH %s '
+            'AND recipes_recipe_fts.rowid = recipes_recipe.id)', (query,),
+            output_field=FloatField()
+        )
+    else:
+        return queryset.filter(
+            Q(name__icontains=query) | Q(text__icontains=query)
+        ).order_by('-pub_date', '-id')
+    return queryset.filter(match).order_by(
+        OrderBy(rank, descending=True), '-pub_date', '-id'
+    )
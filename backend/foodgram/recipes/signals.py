@@ -0,0 +1,200 @@
+import threading
+from collections import Counter, defaultdict
+
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from recipes import versions
+from recipes.models import (Favorite, FeedItem, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Tag)
+from users.models import Subscription, User
+
+BATCH_SIZE = 1000
+
+
+class PendingDeletes(threading.local):
+    """
+    Связи, удаление которых нужно применить к производным данным.
+
+    Удаление (в том числе каскадное, при удалении рецепта или
+    пользователя) сначала шлёт pre_delete для всех объектов, затем
+    удаляет строки модели и шлёт post_delete для каждой. Поэтому
+    pre_delete только запоминает связь, а первый post_delete модели
+    применяет все запомненные связи разом: рецепт из 10 000 корзин
+    вычитается из списков покупок одним проходом.
+    """
+
+    def __init__(self):
+        self.links = defaultdict(dict)
+        self.amounts = {}
+
+    def add(self, instance, link):
+        self.links[type(instance)][instance.pk] = link
+
+    def pop(self, model, using):
+        """
+        Запомненные связи модели. Связи, чьи строки остались в базе
+        (удаление прервалось ошибкой и откатилось), отбрасываются.
+        """
+        links = self.links.pop(model, {})
+        pks = list(links)
+        for start in range(0, len(pks), BATCH_SIZE):
+            for pk in model._base_manager.using(using).filter(
+                pk__in=pks[start:start + BATCH_SIZE]
+            ).values_list('pk', flat=True):
+                del links[pk]
+        return list(links.values())
+
+    def recipe_amounts(self, recipe_id):
+        """
+        Ингредиенты рецепта на момент pre_delete: при удалении рецепта
+        его RecipeIngredient могут быть удалены раньше корзин.
+        """
+        if recipe_id not in self.amounts:
+            self.amounts[recipe_id] = (
+                ShoppingListItem.objects.locked_amounts([recipe_id])
+            )
+        return self.amounts[recipe_id]
+
+
+pending = PendingDeletes()
+
+
+def group_links(links):
+    """
+    Группирует пары (владелец, цель) по набору целей:
+    {frozenset(целей): [владельцы]}. Владельцы с одинаковым набором
+    обновляются одним запросом.
+    """
+    targets = defaultdict(set)
+    for owner, target in links:
+        targets[owner].add(target)
+    groups = defaultdict(list)
+    for owner, owned in targets.items():
+        groups[frozenset(owned)].append(owner)
+    return groups
+
+
+def subtract_counts(field, recipe_ids):
+    """
+    Уменьшает счётчик рецептов на число их вхождений в recipe_ids,
+    одним запросом на каждое различное число.
+    """
+    by_count = defaultdict(list)
+    for recipe_id, count in Counter(recipe_ids).items():
+        by_count[count].append(recipe_id)
+    for count, ids in by_count.items():
+        Recipe.objects.filter(pk__in=ids).add_to_counter(field, -count)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(**kwargs):
+    versions.bump_version(versions.INGREDIENTS)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(**kwargs):
+    versions.bump_version(versions.TAGS)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(instance, **kwargs):
+    versions.bump_version(versions.RECIPE.format(instance.pk))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(instance, created, raw, **kwargs):
+    if created and not raw:
+        FeedItem.objects.fan_out([instance])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_changed(instance, **kwargs):
+    versions.bump_version(versions.RECIPE.format(instance.recipe_id))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(instance, action, **kwargs):
+    if action.startswith('post_') and isinstance(instance, Recipe):
+        versions.bump_version(versions.RECIPE.format(instance.pk))
+
+
+@receiver(post_save, sender=User)
+def user_changed(instance, **kwargs):
+    versions.bump_version(versions.USER.format(instance.pk))
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_created(instance, created, raw, **kwargs):
+    if created and not raw:
+        ShoppingListItem.objects.add_recipes(
+            [instance.user_id], [instance.recipe_id]
+        )
+        Recipe.objects.filter(pk=instance.recipe_id).add_to_counter(
+            'shopping_cart_count', 1
+        )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def shopping_cart_deleting(instance, **kwargs):
+    if not pending.links[ShoppingCart]:
+        pending.amounts.clear()
+    pending.recipe_amounts(instance.recipe_id)
+    pending.add(instance, (instance.user_id, instance.recipe_id))
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def shopping_cart_deleted(sender, using, **kwargs):
+    links = pending.pop(sender, using)
+    subtract_counts(
+        'shopping_cart_count', [recipe_id for _, recipe_id in links]
+    )
+    for recipe_ids, user_ids in group_links(links).items():
+        deltas = Counter()
+        for recipe_id in recipe_ids:
+            deltas.update(pending.amounts[recipe_id])
+        ShoppingListItem.objects.apply_deltas(user_ids, {
+            ingredient_id: -amount for ingredient_id, amount in deltas.items()
+        })
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_created(instance, created, raw, **kwargs):
+    if created and not raw:
+        Recipe.objects.filter(pk=instance.recipe_id).add_to_counter(
+            'favorites_count', 1
+        )
+
+
+@receiver(pre_delete, sender=Favorite)
+def favorite_deleting(instance, **kwargs):
+    pending.add(instance, instance.recipe_id)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, using, **kwargs):
+    subtract_counts('favorites_count', pending.pop(sender, using))
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_created(instance, created, raw, **kwargs):
+    if created and not raw:
+        FeedItem.objects.follow(instance.user_id, [instance.author_id])
+
+
+@receiver(pre_delete, sender=Subscription)
+def subscription_deleting(instance, **kwargs):
+    pending.add(instance, (instance.user_id, instance.author_id))
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_deleted(sender, using, **kwargs):
+    links = pending.pop(sender, using)
+    for author_ids, user_ids in group_links(links).items():
+        FeedItem.objects.unfollow(user_ids, author_ids)
@@ -0,0 +1,76 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            ShoppingListItem)
+from users.models import User
+
+PASSWORD = 'Foodgram-test-123'
+
+
+class CascadeDeleteTest(TestCase):
+    """Сводные списки и счётчики после каскадного удаления связей."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            first_name='Автор', last_name='Рецептов', password=PASSWORD
+        )
+        self.buyer = User.objects.create_user(
+            username='buyer', email='buyer@example.com',
+            first_name='Покупатель', last_name='Продуктов', password=PASSWORD
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Борщ', text='Сварить.',
+            image='recipes/images/borsch.png', cooking_time=60
+        )
+        self.ingredients = [
+            Ingredient.objects.create(name='свёкла', measurement_unit='г'),
+            Ingredient.objects.create(name='капуста', measurement_unit='г'),
+        ]
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=self.recipe, ingredient=ingredient,
+                             amount=100)
+            for ingredient in self.ingredients
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+        response = self.client.post(
+            f'/api/recipes/{self.recipe.pk}/shopping_cart/'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            ShoppingListItem.objects.filter(user=self.buyer).count(), 2
+        )
+
+    def assertListsMatchCarts(self):
+        call_command('rebuild_shopping_lists', check=True, stdout=StringIO())
+        self.assertFalse(
+            ShoppingListItem.objects.filter(user=self.buyer).exists()
+        )
+
+    def test_author_account_deleted(self):
+        author = APIClient()
+        author.force_authenticate(self.author)
+        response = author.delete(
+            '/api/users/me/', {'current_password': PASSWORD}, format='json'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertListsMatchCarts()
+
+    def test_recipe_deleted(self):
+        self.recipe.delete()
+        self.assertListsMatchCarts()
+
+    def test_buyer_account_deleted(self):
+        self.client.post(f'/api/recipes/{self.recipe.pk}/favorite/')
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assertEqual(self.recipe.shopping_cart_count, 1)
+        self.buyer.delete()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+        self.assertEqual(self.recipe.shopping_cart_count, 0)
@@ -0,0 +1,70 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from recipes import constants
+
+TAGS = 'tags'
+INGREDIENTS = 'ingredients'
+RECIPE = 'recipe:{}'
+USER = 'user:{}'
+
+
+def _key(name):
+    return f'version:{name}'
+
+
+def _timeout():
+    """
+    В общем кэше версии хранятся бессрочно. Кэш процесса не видит
+    изменений из других процессов (воркеров и management-команд),
+    поэтому там версия живёт LOCAL_VERSION_TIMEOUT секунд.
+    """
+    return None if settings.SHARED_CACHE else constants.LOCAL_VERSION_TIMEOUT
+
+
+def get_version(name):
+    """
+    Текущая версия набора данных.
+
+    Версия — время последнего изменения в наносекундах. Если значение
+    пропало из кэша, заводится новая версия, чтобы старые ETag и
+    закэшированные ответы перестали совпадать.
+    """
+    version = cache.get(_key(name))
+    if version is None:
+        version = time.time_ns()
+        cache.add(_key(name), version, _timeout())
+        version = cache.get(_key(name), version)
+    return version
+
+
+def get_versions(names):
+    """Версии нескольких наборов данных за одно обращение к кэшу."""
+    keys = {_key(name): name for name in names}
+    found = cache.get_many(keys)
+    missing = {
+        key: time.time_ns() for key in keys if found.get(key) is None
+    }
+    if missing:
+        for key, version in missing.items():
+            cache.add(key, version, _timeout())
+        found.update(cache.get_many(missing))
+    return {
+        name: found.get(key, missing.get(key)) for key, name in keys.items()
+    }
+
+
+def bump_version(name):
+    """
+    Отмечает изменение набора данных.
+
+    Внутри транзакции версия меняется только после коммита: иначе
+    параллельный запрос успел бы закэшировать старые данные
+    под новой версией.
+    """
+    transaction.on_commit(
+        lambda: cache.set(_key(name), time.time_ns(), _timeout())
+    )
@@ -1,9 +1,24 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 
+from recipes.models import Recipe
 from users.models import Subscription, User
 
 
+def count_of(queryset, field):
+    """Подзапрос с числом строк queryset, ссылающихся на пользователя."""
+    return Coalesce(Subquery(
+        queryset.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            total=Count('pk')
+        ).values('total'),
+        output_field=IntegerField()
+    ), 0)
+
+
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
     list_display = (
@@ -12,19 +27,32 @@ class UserAdmin(BaseUserAdmin):
     )
     list_editable = ("username", "email", "password",)
     search_fields = ("username", "email",)
-    list_filter = ("is_active", "first_name", "email",)
+    list_filter = ("is_active", "is_staff",)
+    show_full_result_count = False
 
-    def recipe_count(self, obj):
-        return obj.recipes.count()
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            recipes_total=count_of(Recipe.objects.all(), 'author'),
+            subscriber_total=count_of(Subscription.objects.all(), 'user'),
+        )
 
-    recipe_count.short_description = 'Количество рецептов'
+    @admin.display(
+        description='Количество рецептов', ordering='recipes_total'
+    )
+    def recipe_count(self, obj):
+        return obj.recipes_total
 
+    @admin.display(
+        description='Количество подписчиков', ordering='subscriber_total'
+    )
     def subscriber_count(self, obj):
-        return obj.subscriber.count()
-
-    subscriber_count.short_description = 'Количество подписчиков'
+        return obj.subscriber_total
 
 
 @admin.register(Subscription)
 class SubscribeAdmin(admin.ModelAdmin):
     list_display = ('user', 'author',)
+    list_select_related = ('user', 'author',)
+    search_fields = ('user__username', 'author__username',)
+    autocomplete_fields = ('user', 'author',)
+    show_full_result_count = False